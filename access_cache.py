@@ -0,0 +1,51 @@
+import threading
+import time
+
+# Paid access rarely changes, so positive results can live for a while
+ACCESS_TTL = 300
+# Unpaid users may be about to buy; re-check them sooner
+NO_ACCESS_TTL = 30
+
+
+class AccessCache:
+    """Process-wide cache of user_has_access results with per-entry TTLs."""
+
+    def __init__(self, ttl=ACCESS_TTL, negative_ttl=NO_ACCESS_TTL, clock=time.monotonic):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.hits = 0
+        self.misses = 0
+        self._clock = clock
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        """Return the cached bool for user_id, or None on a miss."""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[1] > self._clock():
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[user_id]
+            self.misses += 1
+            return None
+
+    def set(self, user_id, has_access):
+        ttl = self.ttl if has_access else self.negative_ttl
+        with self._lock:
+            self._entries[user_id] = (bool(has_access), self._clock() + ttl)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "size": len(self._entries),
+            }
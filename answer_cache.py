@@ -0,0 +1,127 @@
+"""Local similarity cache for Tutor Chat answers.
+
+Questions are normalized and indexed with TF-IDF over word unigrams and
+bigrams. A lookup scores only the cached questions that share a term with
+the query (via an inverted index) and returns the best answer whose cosine
+similarity clears the threshold. Entries are evicted least recently used.
+"""
+import math
+import re
+import threading
+from collections import Counter, OrderedDict, defaultdict
+
+ANSWER_CACHE_SIZE = 1000
+SIMILARITY_THRESHOLD = 0.8
+
+_STOPWORDS = frozenset(
+    "a an the is are am do does did i me my you your of to in on at for and or "
+    "if can could should would will what whats when where who how please tell "
+    "about be its there".split()
+)
+# Words that point back at earlier turns; such questions need chat context
+_FOLLOW_UP = re.compile(
+    r"^(and|but|so|also|then|what about|how about|why)\b|\b(it|that|this|those|these|they|them|above|again)\b"
+)
+
+
+def normalize(text):
+    text = re.sub(r"['’]", "", text.lower())
+    text = re.sub(r"[^a-z0-9 ]+", " ", text)
+    return " ".join(text.split())
+
+
+def terms(text):
+    words = [w for w in normalize(text).split() if w not in _STOPWORDS]
+    return Counter(words + [f"{a} {b}" for a, b in zip(words, words[1:])])
+
+
+def is_context_free(text):
+    """Heuristic: True if the question doesn't lean on earlier turns."""
+    return not _FOLLOW_UP.search(normalize(text))
+
+
+class AnswerCache:
+    def __init__(self, max_entries=ANSWER_CACHE_SIZE, threshold=SIMILARITY_THRESHOLD):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.lookups = 0
+        self.hits = 0
+        self.evictions = 0
+        self._next_id = 0
+        self._entries = OrderedDict()      # id -> (normalized question, term counts, answer)
+        self._exact = {}                   # normalized question -> id
+        self._postings = defaultdict(set)  # term -> ids
+        self._lock = threading.Lock()
+
+    def _idf(self, term):
+        return math.log((1 + len(self._entries)) / (1 + len(self._postings.get(term, ())))) + 1
+
+    def _vector(self, counts):
+        vec = {t: (1 + math.log(c)) * self._idf(t) for t, c in counts.items()}
+        norm = math.sqrt(sum(w * w for w in vec.values())) or 1.0
+        return {t: w / norm for t, w in vec.items()}
+
+    def get(self, question, threshold=None):
+        """Return a cached answer for a similar question, or None. A lower
+        ``threshold`` loosens the match (used when the model is unavailable)."""
+        key = normalize(question)
+        with self._lock:
+            self.lookups += 1
+            entry_id = self._exact.get(key)
+            if entry_id is None:
+                entry_id = self._best_match(terms(question), threshold)
+            if entry_id is None:
+                return None
+            self.hits += 1
+            self._entries.move_to_end(entry_id)
+            return self._entries[entry_id][2]
+
+    def _best_match(self, counts, threshold=None):
+        if not counts:
+            return None
+        query = self._vector(counts)
+        candidates = set()
+        for t in counts:
+            candidates |= self._postings.get(t, set())
+        best_id, best_score = None, self.threshold if threshold is None else threshold
+        for entry_id in candidates:
+            vec = self._vector(self._entries[entry_id][1])
+            score = sum(w * vec.get(t, 0.0) for t, w in query.items())
+            if score >= best_score:
+                best_id, best_score = entry_id, score
+        return best_id
+
+    def put(self, question, answer):
+        key = normalize(question)
+        counts = terms(question)
+        with self._lock:
+            if key in self._exact:
+                self._remove(self._exact[key])
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (key, counts, answer)
+            self._exact[key] = entry_id
+            for t in counts:
+                self._postings[t].add(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, entry_id):
+        key, counts, _ = self._entries.pop(entry_id)
+        del self._exact[key]
+        for t in counts:
+            ids = self._postings[t]
+            ids.discard(entry_id)
+            if not ids:
+                del self._postings[t]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_rate": self.hits / self.lookups if self.lookups else 0.0,
+                "evictions": self.evictions,
+                "size": len(self._entries),
+            }
@@ -1,29 +1,76 @@
+import time
+_rerun_start = time.perf_counter()
 import os
 import streamlit as st
-from openai import OpenAI
-from io import BytesIO
-from reportlab.pdfgen import canvas
+import streamlit.components.v1 as components
 import datetime
-import re
-from supabase import create_client, Client
-import stripe
-
-# ── Load configuration from env vars or st.secrets ─────────────────────
-def env_or_secret(env: str, section: str | None, key: str):
-    if env in os.environ:
-        return os.environ[env]
-    if section:
-        if section in st.secrets and key in st.secrets[section]:
-            return st.secrets[section][key]
-    elif key in st.secrets:
-        return st.secrets[key]
-    raise RuntimeError(f"Missing configuration for {env}")
-
-stripe.api_key  = env_or_secret("STRIPE_SECRET_KEY", "stripe", "secret_key")
-PRICE_ID        = env_or_secret("STRIPE_PRICE_ID", "stripe", "price_id")
-SUCCESS_URL     = env_or_secret("STRIPE_SUCCESS_URL", "stripe", "success_url")
-CANCEL_URL      = env_or_secret("STRIPE_CANCEL_URL", "stripe", "cancel_url")
-# ────────────────────────────────────────────────────────────────────────
+import logging
+import copy
+import random
+import uuid
+from collections import Counter, defaultdict
+from openai import APIError
+from question_bank import QuestionBank, REFILL_BATCH
+from chat_context import ChatContext
+from access_cache import AccessCache
+from score_writer import ScoreWriter
+from pdf_export import create_pdf, cache_stats as pdf_cache_stats
+from stream_parse import iter_items
+from fanout import item_key, iter_fanout
+from catalog import (
+    FLASHCARD_PARSER, QUIZ_PARSER, RESPONSE_FORMAT, SYSTEM_PROMPT, TOPICS,
+    flashcard_messages, quiz_messages, shard_messages,
+)
+from answer_cache import AnswerCache, SIMILARITY_THRESHOLD, is_context_free
+import telemetry
+from telemetry import record_usage, span
+from fulfillment import Ledger
+from singleflight import SingleFlight, flight_key
+from llm_scheduler import BACKGROUND, INTERACTIVE, SchedulerBusy, get_scheduler
+from resilience import CircuitOpen, Resilience
+from spaced_repetition import GRADES, CardStore, pick_topics, topic_weights
+from near_dup import NearDupIndex
+from pregenerate import PACK_PATH, read_pack
+from session_store import (
+    IDLE_TTL, MAX_SESSIONS, PERSIST_TTL, SQLiteSessionBackend, SessionStore, new_session_key,
+)
+from resources import (
+    get_openai, get_stripe, get_supabase, get_supabase_srv, new_auth_client, stripe_settings,
+)
+
+logger = logging.getLogger("dmv_tutor")
+
+# === Per-session state (see session_store.py) ===
+@st.cache_resource
+def get_session_store():
+    # SESSION_DB lets several app processes share sessions and keeps them across restarts
+    path = os.environ.get("SESSION_DB")
+    return SessionStore(
+        SQLiteSessionBackend(path) if path else None,
+        max_sessions=int(os.environ.get("MAX_SESSIONS", MAX_SESSIONS)),
+        idle_ttl=float(os.environ.get("SESSION_IDLE_TTL", IDLE_TTL)),
+    )
+
+SESSION_COOKIE = "dmv_session"
+
+def browser_key():
+    # A random key in a cookie, so a reload (or a rerun served by another
+    # process) finds the same record. It grants nothing by itself: records
+    # are keyed by user id too and only read after login.
+    key = st.session_state.get("browser_key") or st.context.cookies.get(SESSION_COOKIE)
+    if not key:
+        key = new_session_key()
+        # Streamlit can't set cookies from the server; set it from the page
+        components.html(
+            f"<script>parent.document.cookie = '{SESSION_COOKIE}={key}; path=/; "
+            f"max-age={PERSIST_TTL}; SameSite=Strict';</script>",
+            height=0,
+        )
+    st.session_state["browser_key"] = key
+    return key
+
+def save_session():
+    get_session_store().save(session)
 
 # --- Stripe post-checkout session handler (run BEFORE login check!) ---
 params = st.query_params
@@ -36,140 +83,438 @@ if "session_id" in params:
     st.query_params = {}
 
 def create_checkout_session(user_email: str, user_id: str) -> str:
-    session = stripe.checkout.Session.create(
-        payment_method_types=["card"],
-        customer_email=user_email,
-        line_items=[{"price": PRICE_ID, "quantity": 1}],
-        mode="payment",
-        success_url=f"{SUCCESS_URL}?session_id={{CHECKOUT_SESSION_ID}}",
-        cancel_url=CANCEL_URL,
-        metadata={"user_id": user_id, "user_email": user_email},  # <--- add this!
-    )
+    stripe = get_stripe()
+    settings = stripe_settings()
+    with span("stripe.checkout_create"):
+        session = stripe.checkout.Session.create(
+            payment_method_types=["card"],
+            customer_email=user_email,
+            line_items=[{"price": settings["price_id"], "quantity": 1}],
+            mode="payment",
+            success_url=f"{settings['success_url']}?session_id={{CHECKOUT_SESSION_ID}}",
+            cancel_url=settings["cancel_url"],
+            metadata={"user_id": user_id, "user_email": user_email},  # <--- add this!
+        )
     return session.url
 
 
-def verify_and_grant_access(session_id: str, user_id: str = None) -> bool:
-    try:
-        session = stripe.checkout.Session.retrieve(session_id)
-        if session.payment_status == "paid":
-            # Try using provided user_id, or fallback to metadata
-            uid = user_id or session.metadata.get("user_id")
-            if not uid:
-                st.error("Unable to verify user ID after payment. Please contact support.")
-                return False
-            supabase_srv.table("user_access").upsert({"user_id": uid}).execute()
-            return True
-    except Exception as e:
-        st.error(f"Stripe verification failed: {e}")
-    return False
+# === Purchase fulfillment ===
+# Access is granted by the Stripe webhook server (fulfillment.py); the app
+# only reads its ledger, so login never waits on Stripe.
+@st.cache_resource
+def get_ledger() -> Ledger:
+    return Ledger(os.environ.get("FULFILLMENT_DB", "fulfillment.db"))
+
+
+def check_purchase(session_id: str, user_id: str) -> str:
+    """Return "granted", "pending" or "failed" for a returning checkout."""
+    with span("ledger.purchase_status"):
+        row = get_ledger().status(session_id)
+    if row and row[0] == "granted":
+        get_access_cache().set(row[1] or user_id, True)   # show the purchase right away
+        return "granted"
+    # Webhook not processed yet: re-check Supabase on the next rerun
+    get_access_cache().invalidate(user_id)
+    return row[0] if row else "pending"
+
+
+def show_purchase_status(status: str):
+    if status == "granted":
+        st.success("Payment confirmed – access unlocked! 🎉")
+    elif status == "pending":
+        st.info("Payment received – your access will unlock in a few seconds.")
+    else:
+        st.warning("Payment could not be verified. Please contact support if this was an error.")
+
+
+@st.cache_resource
+def get_access_cache() -> AccessCache:
+    return AccessCache()
 
 
 def user_has_access(user_id: str) -> bool:
     """Check if the user already purchased Lifetime Access."""
-    res = supabase.table("user_access").select("user_id").eq("user_id", user_id).execute()
-    return bool(res.data)
-
-# === Load credentials ===
-supabase_url = env_or_secret("SUPABASE_URL", "supabase", "url")
-supabase_anon_key = env_or_secret("SUPABASE_ANON_KEY", "supabase", "anon_key")
-supabase_service_key = env_or_secret("SUPABASE_SERVICE_ROLE_KEY", "supabase", "service_key")
-api_key = env_or_secret("OPENAI_API_KEY", None, "openai_api_key")
-# === Initialize Supabase and OpenAI ===
-supabase: Client = create_client(supabase_url, supabase_anon_key)
-client = OpenAI(api_key=api_key, project="proj_36JJwFCLQG34Xyiqb0EWUJlN")
-# === Initialize Supabase "admin" client for bypassing RLS (used ONLY for access unlock) ===
-supabase_srv: Client = create_client(supabase_url, supabase_service_key)
-
-# === System Prompt ===
-SYSTEM_PROMPT = (
-    "You are a certified South Carolina DMV Permit Test Tutor specializing in helping teenagers "
-    "prepare for their written learner’s permit exam.\n\n"
-    "Your job is to clearly explain driving laws, road signs, traffic rules, and safety principles "
-    "using only the information found in:\n"
-    "- The South Carolina Driver’s Manual (2024 edition), and\n"
-    "- The official SC DMV Practice Test: https://practice.dmv-test-pro.com/south-carolina/sc-permit-practice-test-19/\n\n"
-    "Key instructions:\n"
-    "- ONLY use facts found in the manual or practice test.\n"
-    "- DO NOT make up laws, facts, or explanations.\n"
-    "- Use language appropriate for 15- to 17-year-olds.\n"
-    "- When creating a quiz, strictly follow this format:\n"
-    "Question 1: [question text]\n"
-    "A. [option A]\n"
-    "B. [option B]\n"
-    "C. [option C]\n"
-    "D. [option D]\n"
-    "Answer: [A/B/C/D]\n\n"
-    "- Start each question with 'Question [number]:'.\n"
-    "- Return EXACTLY N questions in the specified format.\n"
-    "- DO NOT include explanations, hints, or any extra text.\n"
-    "- Make sure all questions are unique and properly numbered.\n\n"
-    "- When creating flashcards, strictly follow this format:\n"
-    "Q: [question]\nA: [answer]\n"
-    "- Return exactly 10 Q/A flashcards and nothing else. No numbering, no MCQ, no explanations, no commentary.\n\n"
-    "**Failure to follow these instructions will result in broken output.**"
-        "\n\n"
-    "Proactive guidance:\n"
-    "- After answering the user's question, briefly suggest ONE effective test‑taking or study strategy (e.g. spaced repetition, practice under timed conditions).\n"
-    "- Then, recommend a relevant feature of this website (Practice Quiz, Flashcards, Study Plan, or Progress Tracker) and explain in one sentence how using it will help them master the permit test faster.\n"
-    "- Keep the tip + recommendation to a total of **two sentences** so it doesn't feel spammy."
+    cache = get_access_cache()
+    cached = cache.get(user_id)
+    if cached is not None:
+        return cached
+    with span("supabase.user_access"):
+        res = supabase.table("user_access").select("user_id").eq("user_id", user_id).execute()
+    has_access = bool(res.data)
+    cache.set(user_id, has_access)
+    return has_access
+
+# === Shared clients (built once per process, see resources.py) ===
+telemetry.set_page("Startup")   # until a page is chosen below
+supabase = get_supabase()
+client = get_openai()
+# Supabase "admin" client for bypassing RLS (batched score writes, progress reads)
+supabase_srv = get_supabase_srv()
+
+def progress_rpc(name, **params):
+    # The rollup tables are RLS-protected and the shared anon client carries
+    # no user JWT, so progress is read through service-role-only functions
+    # (supabase/migrations/*_quiz_progress_functions.sql)
+    return supabase_srv.rpc(name, params).execute().data or []
+_first_run = "_warm" not in st.session_state
+st.session_state["_warm"] = True
+logger.info(
+    "rerun setup took %.1f ms (%s)",
+    (time.perf_counter() - _rerun_start) * 1000, "cold" if _first_run else "warm"
 )
+
+# Days of history shown per page on the Progress Tracker
+PROGRESS_DAYS_PER_PAGE = 14
+
+# === Study Plan ===
+STUDY_PLAN = """
+## 🚦 3‑Day “Permit‑Ready” Study Plan  
+_All you need is right here on your DMV Tutor site_
+
+---
+
+### DAY 1 – MASTER THE BASICS
+
+• **10 min – Game Plan Kick‑Off**  
+  ○ Skim this schedule and set a mini‑goal for today.  
+  ○ Tool: 3‑Day Plan page  
+
+• **20 min – Chat with the AI Tutor**  
+  ○ Ask: “What mistakes do first‑time drivers make most?”  
+  ○ Get quick, teen‑friendly explanations.  
+
+• **25 min – General Quiz Attack**  
+  ○ Go to _Practice Quiz → General_.  
+  ○ Discover what you already know (or don’t).  
+
+• **15 min – Traffic Signals Flashcards**  
+  ○ Flashcards → Traffic Signals to lock in light colors & arrow shapes.  
+
+• **5 min – Progress Check‑In**  
+  ○ Enter today’s quiz score in _Progress Tracker_.  
+  ○ Jot one topic that felt tough—AI Tutor will focus on it tomorrow.  
+
+---
+
+### DAY 2 – DIAL IN THE DETAILS
+
+• **10 min – Road Signs Warm‑Up**  
+  ○ Flashcards → Road Signs (speedy picture‑memory boost).  
+
+• **20 min – Rapid‑Fire Q&A**  
+  ○ AI Tutor: “Give me 5 tips to remember right‑of‑way rules.”  
+
+• **25 min – Right‑of‑Way Quiz**  
+  ○ Practice Quiz → Right of Way.  
+  ○ Put those fresh tips to the test.  
+
+• **15 min – Speed Limits Flashcards**  
+  ○ Flashcards → Speed Limits to nail the numbers.  
+
+• **10 min – Progress Tracker Update**  
+  ○ Mark new scores, celebrate streaks, spot weak points.  
+
+• **Evening Mini‑Challenge (Optional 10 min)**  
+  ○ Re‑take yesterday’s General Quiz and beat your score.  
+
+---
+
+### DAY 3 – GAME‑DAY SIMULATION
+
+• **15 min – Flashcard Fix‑Up**  
+  ○ Hit any topic where you’re under 80 %. Lightning review.  
+
+• **35 min – Full‑Length Mock Quiz**  
+  ○ Practice Quiz → General. Do it twice back‑to‑back for real‑test stamina.  
+
+• **15 min – Last‑Minute AI Tutor Grill‑Session**  
+  ○ Ask: “Quiz me on 10 tricky alcohol‑law questions.”  
+  ○ Get instant correction & tips.  
+
+• **5 min – Final Progress High‑Five**  
+  ○ Open _Progress Tracker_, admire the glow‑up, and breathe. You’re ready!  
+
+---
+
+### PRO TIPS
+
+• **Chunk it → Check it:** tick off each block in Progress Tracker for a mini dopamine hit.  
+• **Speak answers out loud:** saying flashcard answers cements memory.  
+• **Move & hydrate:** quick stretch or sip of water between blocks keeps your brain sharp.  
+• **Use “Explain like I’m 14”:** anytime you’re lost, type this to the AI Tutor for a simpler breakdown.  
+
+Stick to the plan, trust the tools, and you’ll cruise through the SC permit test. **You got this!** 🚗💨
+"""
+
+@st.cache_resource
+def study_plan_pdf():
+    return create_pdf(STUDY_PLAN)
+
+# Prebuild the static study-plan PDF once per process
+study_plan_pdf()
+# === Deadlines, retries, hedging and model fallback for OpenAI calls ===
+@st.cache_resource
+def get_resilience():
+    # A hedge takes a scheduler slot only if one is free right now, so hedges
+    # never exceed the concurrency cap or delay other users
+    return Resilience(
+        primary="gpt-4-turbo",
+        fallback=os.environ.get("OPENAI_FALLBACK_MODEL", "gpt-4o-mini"),
+        acquire_hedge=lambda: get_scheduler().try_acquire(),
+        release_hedge=lambda: get_scheduler().release(),
+    )
 # === Query GPT ===
-def query_gpt(messages):
-    response = client.chat.completions.create(
-        model="gpt-4-turbo",
-        messages=messages
+def query_gpt(messages, priority=INTERACTIVE, user_id=None, response_format=None):
+    # Every call waits for a slot from the process-wide scheduler
+    extra = {"response_format": response_format} if response_format else {}
+
+    def complete(model, timeout):
+        with span("openai.chat", model=model):
+            response = client.with_options(timeout=timeout, max_retries=0).chat.completions.create(
+                model=model,
+                messages=messages,
+                **extra
+            )
+        record_usage(model, response.usage)
+        return response.choices[0].message.content
+
+    with get_scheduler().slot(priority, user_id):
+        return get_resilience().call(complete)
+# === Stream GPT token by token ===
+def query_gpt_stream(messages, timings=None, priority=INTERACTIVE, user_id=None):
+    # Fills timings["first_token"] and timings["total"] (seconds) if given.
+    # Opening the stream is retried; once tokens flow, errors propagate.
+    timings = {} if timings is None else timings
+    start = time.perf_counter()
+
+    def open_stream(model, timeout):
+        return model, client.with_options(timeout=timeout, max_retries=0).chat.completions.create(
+            model=model,
+            messages=messages,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+
+    resilience = get_resilience()
+    with get_scheduler().slot(priority, user_id):
+        model, stream = resilience.call(open_stream, hedge=False, kind="stream")
+        with span("openai.chat_stream", model=model):
+            try:
+                for chunk in stream:
+                    if chunk.usage:
+                        record_usage(model, chunk.usage)
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        if "first_token" not in timings:
+                            timings["first_token"] = time.perf_counter() - start
+                            telemetry.observe("dmv_openai_first_token_seconds", timings["first_token"], model=model)
+                        yield delta
+            except Exception:
+                resilience.record_failure(model)
+                raise
+    timings["total"] = time.perf_counter() - start
+# === Fold old chat turns into a rolling summary ===
+def summarize_chat(summary, messages, user_id=None):
+    transcript = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+    return query_gpt([
+        {"role": "system", "content": (
+            "You maintain a short running summary of a tutoring chat between a student "
+            "and a DMV permit test tutor. Update the summary with the new messages. "
+            "Keep the student's questions, weak spots and anything they were told to "
+            "remember. Reply with the summary only, under 200 words."
+        )},
+        {"role": "user", "content": f"Current summary:\n{summary or '(none)'}\n\nNew messages:\n{transcript}"}
+    ], user_id=user_id)
+# === Answer cache for repeated, context-free chat questions ===
+# Looser match used only when no model can answer
+FALLBACK_SIMILARITY = 0.5
+@st.cache_resource
+def get_answer_cache():
+    return AnswerCache(
+        threshold=float(os.environ.get("ANSWER_CACHE_THRESHOLD", SIMILARITY_THRESHOLD))
+    )
+# Extra rounds that ask only for the items still missing
+MAX_TOP_UPS = 2
+# === Render quiz/flashcard items as they stream in ===
+def stream_items(make_parser, make_messages, topic, num, render, user_id=None):
+    # Runs the shards concurrently; render(i, item) draws a preview of each
+    # item the moment any shard completes it. Previews are cleared once the
+    # full set is in. Items that fail validation or repeat a stem are
+    # dropped, and follow-up rounds ask only for the missing count.
+    preview = st.empty()
+    items = []
+    errors = []
+    in_set = NearDupIndex()
+    with preview.container():
+        for round_no in range(1 + MAX_TOP_UPS):
+            missing = num - len(items)
+            if missing <= 0:
+                break
+            model = get_resilience().preferred_model()
+            if model is None:
+                raise CircuitOpen("OpenAI is failing right now; every model's circuit is open")
+            if round_no:
+                telemetry.inc("dmv_llm_topups_total", page=telemetry.current_page())
+            message_sets = shard_messages(make_messages, topic, missing, [i["question"] for i in items])
+            try:
+                for item in iter_fanout(message_sets, make_parser, errors=errors, model=model, user_id=user_id,
+                                        exclude={item_key(i) for i in items}, response_format=RESPONSE_FORMAT,
+                                        on_result=lambda e, m=model: get_resilience().record_result(m, e)):
+                    if not in_set.add(topic, item):
+                        errors.append({"reason": "near duplicate", "text": item["question"]})
+                    elif len(items) < num:
+                        items.append(item)
+                        render(len(items), item)
+            except Exception as e:
+                if not round_no:
+                    raise
+                # A failed top-up still leaves the items we have
+                logger.warning("top-up round failed: %s", e)
+    preview.empty()
+    if errors:
+        st.warning(f"Skipped {len(errors)} item(s) that came back incomplete or malformed.")
+    if len(items) < num:
+        st.info(f"Only {len(items)} of {num} could be generated this time.")
+    return items
+# === Share identical in-flight generations across sessions ===
+@st.cache_resource
+def get_single_flight():
+    return SingleFlight()
+
+def generate_shared(page, topic, num, make_parser, make_messages, render, user_id=None, save=None):
+    # The first caller streams the items and, if given, runs save(items)
+    # before anyone is released; identical requests that arrive while it
+    # runs wait for its result and get their own shuffled copy, already saved
+    def lead():
+        items = stream_items(make_parser, make_messages, topic, num, render, user_id)
+        if save:
+            save(items)
+        return items
+
+    key = flight_key(page, topic, num, make_messages(topic, num))
+    with st.spinner("Creating your set..."):
+        items, shared = get_single_flight().do(key, lead)
+    if shared:
+        telemetry.inc("dmv_llm_coalesced_total", page=page)
+        items = copy.deepcopy(random.sample(items, len(items)))
+    return items
+# === Question bank (shared by all sessions in this process) ===
+@st.cache_resource
+def get_question_bank():
+    return QuestionBank(os.environ.get("QUESTION_BANK_PATH", "question_bank.db"))
+
+def refill_question_bank(topic):
+    # Background top-up; keeps "Generate Quiz" off the LLM for the next user
+    get_question_bank().refill_async(
+        topic, lambda: get_near_dup_index().filter(("quiz", topic), iter_items(QUIZ_PARSER(), [
+            query_gpt(quiz_messages(topic, REFILL_BATCH), priority=BACKGROUND, response_format=RESPONSE_FORMAT)
+        ]))
     )
-    return response.choices[0].message.content
-# === Parse quiz from GPT format ===
-def parse_quiz(raw_text):
-    pattern = re.compile(
-        r"Question\s+\d+:\s*(.*?)\nA\.\s*(.*?)\nB\.\s*(.*?)\nC\.\s*(.*?)\nD\.\s*(.*?)\nAnswer:\s*([A-D])",
-        re.DOTALL
+# === Spaced-repetition flashcards ===
+ALL_TOPICS = "All topics (weak spots first)"
+# Cards per review session
+REVIEW_SESSION_SIZE = 10
+# Cards generated per LLM call when the pool runs dry; extras stay in the pool
+NEW_CARD_BATCH = 10
+# Only call the LLM for new cards when fewer than this many are due
+SHORT_QUEUE = 5
+
+@st.cache_resource
+def get_card_store():
+    return CardStore(os.environ.get("FLASHCARD_DB", "flashcards.db"))
+
+# === Near-duplicate filter in front of the question bank and card pool ===
+@st.cache_resource
+def get_near_dup_index():
+    # Seeded from both stores so restarts keep rejecting old repeats. Hashing
+    # a large store takes seconds, so it runs in the background from startup.
+    def stored_items():
+        for topic, q in get_question_bank().iter_questions():
+            yield ("quiz", topic), q
+        for topic, card in get_card_store().iter_cards():
+            yield ("flashcards", topic), card
+    return NearDupIndex().seed_in_background(stored_items)
+
+# === Pre-generated content (pregenerate.py) ===
+@st.cache_resource
+def load_pregenerated():
+    # Once per process, before the near-duplicate index is seeded from the stores
+    path = os.environ.get("PREGENERATED_PATH", PACK_PATH)
+    if not os.path.exists(path):
+        return 0
+    by_part = defaultdict(list)
+    for kind, topic, item in read_pack(path):
+        by_part[(kind, topic)].append(item)
+    added = 0
+    for (kind, topic), items in by_part.items():
+        if kind == "quiz":
+            added += get_question_bank().add(topic, items)
+        else:
+            added += get_card_store().add_cards(topic, items)
+    logger.info("Loaded %d new items from %s", added, path)
+    return added
+
+load_pregenerated()
+get_near_dup_index()
+
+def weak_topic_weights(user_id):
+    # Miss rate per topic from the quiz rollups; weak topics get more new cards
+    with span("supabase.flashcard_weights"):
+        rows = progress_rpc("progress_topics", p_user_id=user_id)
+    return topic_weights(TOPICS, rows)
+
+def new_flashcards(user_id, topics, n, generate=True):
+    # Unseen cards from the shared pool first; at most one LLM batch, for
+    # the topic that is furthest short, only if the pool can't cover it
+    store = get_card_store()
+    wanted = Counter(topics[i % len(topics)] for i in range(n)) if topics else Counter(
+        pick_topics(weak_topic_weights(user_id), n)
     )
-    matches = pattern.findall(raw_text)
-    questions = []
-    for match in matches:
-        question, a, b, c, d, answer = match
-        questions.append({
-            "question": question.strip(),
-            "options": {
-                "A": a.strip(),
-                "B": b.strip(),
-                "C": c.strip(),
-                "D": d.strip()
-            },
-            "answer": answer.strip()
-        })
-    return questions
-# === Parse flashcards from GPT format ===
-def parse_flashcards(raw_text):
-    # Looks for: Q: ... \nA: ...
-    pattern = re.compile(r"Q:\s*(.*?)\nA:\s*(.*?)(?=\nQ:|\Z)", re.DOTALL)
-    cards = pattern.findall(raw_text)
-    return [{"question": q.strip(), "answer": a.strip()} for q, a in cards]
-# === Create PDF ===
-def create_pdf(text):
-    buffer = BytesIO()
-    pdf = canvas.Canvas(buffer)
-    y = 800
-    for line in text.split("\n"):
-        if y < 40:
-            pdf.showPage()
-            y = 800
-        pdf.drawString(40, y, line)
-        y -= 15
-    pdf.save()
-    buffer.seek(0)
-    return buffer
+    cards, short = [], Counter()
+    for topic, count in wanted.items():
+        got = store.assign_new(user_id, topic, count)
+        cards += got
+        if len(got) < count:
+            short[topic] = count - len(got)
+    if short and generate:
+        topic = short.most_common(1)[0][0]
+        generate_shared(
+            "flashcards", topic, NEW_CARD_BATCH, FLASHCARD_PARSER, flashcard_messages,
+            lambda i, c: st.markdown(f"**Q{i}: {c['question']}**"), user_id,
+            save=lambda items: store.add_cards(topic, get_near_dup_index().filter(("flashcards", topic), items)),
+        )
+        # Coalesced callers included: the leader has added the new cards by now
+        cards += store.assign_new(user_id, topic, sum(short.values()))
+    return cards
 # === Save to Supabase ===
+# Inserts into quiz_scores also update the per-day and per-topic rollup
+# tables via a database trigger (supabase/migrations/*_quiz_score_rollups.sql)
+@st.cache_resource
+def get_score_writer():
+    # One write-behind queue per process, shared by every session. Batches
+    # hold rows for many users, so they go through the service-role client.
+    return ScoreWriter(insert_scores)
+
+def insert_scores(rows):
+    # Upsert on the client id: a retry of a batch that did commit (e.g. the
+    # response timed out) skips rows already there instead of counting them twice
+    with span("supabase.insert_quiz_scores", rows=len(rows)):
+        supabase_srv.table("quiz_scores").upsert(
+            rows, on_conflict="client_id", ignore_duplicates=True
+        ).execute()
+
 def save_score(user_id, topic, correct, attempted):
-    supabase.table("quiz_scores").insert({
+    # Returns as soon as the row is queued; the writer thread inserts it
+    get_score_writer().enqueue({
+        "client_id": str(uuid.uuid4()),
         "user_id": user_id,
         "topic": topic,
         "correct": correct,
         "attempted": attempted,
         "date": str(datetime.date.today())
-    }).execute()
+    })
 # === Login UI ===
 def login_ui():
     st.subheader("Login / Sign Up")
@@ -177,54 +522,65 @@ def login_ui():
     password = st.text_input("Password", type="password")
     if st.button("Log In"):
         try:
-            user = supabase.auth.sign_in_with_password({"email": email, "password": password})
+            with span("supabase.sign_in"):
+                user = new_auth_client().auth.sign_in_with_password({"email": email, "password": password})
             if user.user:
                 st.session_state["user"] = user.user
                 st.success("Logged in successfully!")
                 if "post_login_session_id" in st.session_state:
                     sid = st.session_state.pop("post_login_session_id")
-                    access_granted = verify_and_grant_access(sid, user.user.id)
-                    if access_granted:
-                        st.success("Payment confirmed – access unlocked! 🎉")
-                    else:
-                        st.warning("Payment could not be verified. Please contact support if this was an error.")
-                    st.experimental_rerun()
+                    show_purchase_status(check_purchase(sid, user.user.id))
+                    st.rerun()
                 else:
-                    st.experimental_rerun()
+                    st.rerun()
         except Exception:
             st.error("Login failed. Check your credentials.")
     if st.button("Sign Up"):
         try:
-            result = supabase.auth.sign_up({"email": email, "password": password})
+            result = new_auth_client().auth.sign_up({"email": email, "password": password})
             if result.user:
                 st.success("Account created! Check your email.")
         except Exception:
             st.error("Signup failed. Email may already be registered.")
+# === Metrics: /metrics and /traces on METRICS_PORT, if set ===
+@st.cache_resource
+def start_telemetry():
+    telemetry.register_collector("dmv_access_cache", lambda: get_access_cache().stats())
+    telemetry.register_collector("dmv_answer_cache", lambda: get_answer_cache().stats())
+    telemetry.register_collector("dmv_score_writer", lambda: get_score_writer().stats())
+    telemetry.register_collector("dmv_pdf_cache", pdf_cache_stats)
+    telemetry.register_collector("dmv_single_flight", lambda: get_single_flight().stats())
+    telemetry.register_collector("dmv_llm_scheduler", lambda: get_scheduler().stats())
+    telemetry.register_collector("dmv_llm_resilience", lambda: get_resilience().stats())
+    telemetry.register_collector("dmv_flashcards", lambda: get_card_store().stats())
+    telemetry.register_collector("dmv_near_dup", lambda: get_near_dup_index().stats())
+    telemetry.register_collector("dmv_sessions", lambda: get_session_store().stats())
+    port = os.environ.get("METRICS_PORT")
+    return telemetry.start_metrics_server(int(port)) if port else None
+
+start_telemetry()
 # === App Setup ===
 st.set_page_config(page_title="SC DMV AI Tutor", layout="centered")
 st.title("SC DMV Permit Test Tutor")
 if "user" not in st.session_state:
+    telemetry.set_page("Login")
     login_ui()
     st.stop()
 user = st.session_state["user"]
+session = get_session_store().get(f"{user.id}:{browser_key()}")
 
 def process_pending_stripe():
     # Only run if just-logged-in and have a pending Stripe session
     sid = st.session_state.pop("post_login_session_id", None)
     if sid:
-        access_granted = verify_and_grant_access(sid, user.id)
-        if access_granted:
-            st.success("Payment confirmed – access unlocked! 🎉")
-        else:
-            st.warning("Payment could not be verified. Please contact support if this was an error.")
-        st.experimental_rerun()
+        show_purchase_status(check_purchase(sid, user.id))
+        st.rerun()
 
 process_pending_stripe()
 # ---- Stripe redirect handler -------------------------------------------
 
 has_access = user_has_access(user.id)   # do they own Lifetime Access?
-st.write("DEBUG: user.id", user.id)
-st.write("DEBUG: has_access is", has_access)
+logger.debug("user %s has_access=%s", user.id, has_access)
 checkout_url = None                    # will hold Stripe URL if we create one
 # -------------------------------------------------------------------------
 
@@ -271,13 +627,14 @@ else:
     nav_items = ["What You Get"]          # CTA page only before purchase
 
 menu = st.sidebar.radio("Navigation", nav_items)
+page_timer = telemetry.PageTimer(menu)
 # ------------------------------------------------------------------------
+try:
+    # === What You Get (CTA) ================================================
+    if menu == "What You Get":
+        st.header("Unlock the Full DMV Tutor Experience 🚀")
 
-# === What You Get (CTA) ================================================
-if menu == "What You Get":
-    st.header("Unlock the Full DMV Tutor Experience 🚀")
-
-    st.markdown("""
+        st.markdown("""
 ### Lifetime Access – $30 one‑time
 
 | Feature | Why it rocks |
@@ -295,262 +652,258 @@ Click **“Buy Lifetime Access”** in the sidebar to open secure Stripe Checkou
 Come back with everything unlocked in under a minute!
 """)
 
-    st.stop()   # prevent other pages from rendering until purchase
-# =======================================================================
-
-# === Tutor Chat ===
-if menu == "Tutor Chat":
-    st.header("Chat with Your DMV Tutor")
-    if "chat_history" not in st.session_state:
-        st.session_state.chat_history = [
-            {"role": "system", "content": SYSTEM_PROMPT}
-        ]
-    for msg in st.session_state.chat_history[1:]:
-        st.chat_message(msg["role"]).write(msg["content"])
-    user_input = st.chat_input("Ask a question about the permit test...")
-    if user_input:
-        st.session_state.chat_history.append({"role": "user", "content": user_input})
-        with st.spinner("Thinking..."):
-            response = query_gpt(st.session_state.chat_history)
-        st.session_state.chat_history.append({"role": "assistant", "content": response})
-        st.chat_message("user").write(user_input)
-        st.chat_message("assistant").write(response)
-    if st.button("Clear Chat"):
-        st.session_state.chat_history = [
-            {"role": "system", "content": SYSTEM_PROMPT}
-        ]
-        st.rerun()
-# === Practice Quiz ===
-elif menu == "Practice Quiz":
-    if not has_access:
-        st.error("Please purchase Lifetime Access to use Practice Quizzes.")
-        st.stop()
-
-    st.header("Practice Quiz")
-    st.info("For each question, select your answer. No answer is selected by default. You must answer every question to submit the quiz.")
-
-    num = st.slider("Number of Questions", 5, 10, 5)
-    topic = st.selectbox(
-        "Quiz Topic",
-        ["General", "Road Signs", "Right of Way", "Alcohol Laws", "Speed Limits", "Traffic Signals"]
-    )
+        st.stop()   # prevent other pages from rendering until purchase
+    # =======================================================================
 
-    if st.button("Generate Quiz"):
-        prompt = (
-            f"Generate exactly {num} multiple-choice questions for the topic '{topic}' from the South Carolina DMV permit test. "
-            "Each must follow this format:\n"
-            "Question 1: [question]\n"
-            "A. [option A]\n"
-            "B. [option B]\n"
-            "C. [option C]\n"
-            "D. [option D]\n"
-            "Answer: [correct option letter]\n\n"
-            "Return ONLY the questions — no explanations, no commentary, no extra text. "
-            "Number all questions correctly and provide the correct answer for each."
+    # === Tutor Chat ===
+    if menu == "Tutor Chat":
+        st.header("Chat with Your DMV Tutor")
+        # The summary of folded turns lives in the session record, not the context object
+        chat_context = ChatContext(
+            lambda summary, messages: summarize_chat(summary, messages, user.id), budget=int(os.environ.get("CHAT_TOKEN_BUDGET", "6000"))
         )
-        with st.spinner("Creating your quiz..."):
-            raw_quiz = query_gpt([
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": prompt}
-            ])
-            st.session_state["quiz_data"] = parse_quiz(raw_quiz)
-            st.session_state["quiz_answers"] = {}
-            st.session_state["quiz_submitted"] = False
-
-    if "quiz_data" in st.session_state:
-        st.subheader("Take the Quiz")
-        quiz_data = st.session_state["quiz_data"]
-        all_answered = True
-
-        for idx, q in enumerate(quiz_data):
-            label = f"{idx + 1}. {q['question']}"
-            options = ["Select an answer..."] + [f"{key}. {val}" for key, val in q["options"].items()]
-            selected = st.radio(label, options, key=f"q_{idx}", index=0)
-
-            if selected != "Select an answer...":
-                st.session_state["quiz_answers"][idx] = selected[0]
+        chat_context.summary, chat_context.folded = session.chat_summary, session.chat_folded
+        for role, content in session.chat:
+            st.chat_message(role).write(content)
+        user_input = st.chat_input("Ask a question about the permit test...")
+        if user_input:
+            first_turn = not session.chat
+            cacheable = first_turn or is_context_free(user_input)
+            session.add_message("user", user_input)
+            st.chat_message("user").write(user_input)
+            answer_cache = get_answer_cache()
+            response = answer_cache.get(user_input) if cacheable else None
+            if response is not None:
+                st.chat_message("assistant").write(response)
             else:
-                st.session_state["quiz_answers"][idx] = None
-                all_answered = False
-
-        if st.button("Submit Quiz", disabled=not all_answered):
-            st.session_state["quiz_submitted"] = True
-            correct = sum(
-                1 for idx, q in enumerate(quiz_data)
-                if st.session_state["quiz_answers"].get(idx) == q["answer"]
-            )
-            save_score(user.id, topic, correct, len(quiz_data))
-            st.success(f"You got {correct} out of {len(quiz_data)} correct!")
-            st.markdown("**Correct Answers:**")
-            for i, q in enumerate(quiz_data):
-                st.markdown(f"- Question {i+1}: {q['answer']}")
-
-# === Flashcards ===
-elif menu == "Flashcards":
-    if not has_access:
-        st.error("Please purchase Lifetime Access to use Flashcards.")
-        st.stop()
-
-    st.header("Flashcards")
-    topic = st.selectbox(
-        "Flashcard Topic",
-        ["General", "Road Signs", "Right of Way", "Alcohol Laws", "Speed Limits", "Traffic Signals"]
-    )
-
-    if st.button("Generate Flashcards"):
-        prompt = (
-            f"Generate 10 flashcards for the topic '{topic}' using a Q&A format only from the SC permit test. "
-            "Each flashcard should have a clear question and a short, clear answer. "
-            "Use exactly this format for each flashcard: Q: [question]\nA: [answer]\n"
-            "Return ONLY flashcards, no extra text, no multiple choice, and no explanations."
-        )
-        with st.spinner("Creating flashcards..."):
-            raw_flashcards = query_gpt([
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": prompt}
-            ])
-            flashcards_data = parse_flashcards(raw_flashcards)
-            st.session_state["flashcards_data"] = flashcards_data
-            st.session_state["flashcard_revealed"] = [False] * len(flashcards_data)
-
-    if "flashcards_data" in st.session_state:
-        st.subheader(f"{topic} Flashcards")
-
-        for idx, card in enumerate(st.session_state["flashcards_data"]):
-            st.markdown(f"**Q{idx+1}: {card['question']}**")
-            if not st.session_state["flashcard_revealed"][idx]:
-                if st.button("Reveal Answer", key=f"reveal_btn_{idx}"):
-                    st.session_state["flashcard_revealed"][idx] = True
-
-            if st.session_state["flashcard_revealed"][idx]:
-                st.success(f"**A{idx+1}: {card['answer']}**")
-            st.write("---")
-
-        # Download option
-        flashcard_text = "\n\n".join(
-            [f"Q{idx+1}: {c['question']}\nA{idx+1}: {c['answer']}" 
-             for idx, c in enumerate(st.session_state["flashcards_data"])]
-        )
-        st.download_button(
-            "Download PDF", create_pdf(flashcard_text), file_name="flashcards.pdf"
-        )
-
-# === Study Plan ===
-elif menu == "Study Plan":
-    st.header("3-Day Study Plan")
-    plan = """
-## 🚦 3‑Day “Permit‑Ready” Study Plan  
-_All you need is right here on your DMV Tutor site_
-
----
-
-### DAY 1 – MASTER THE BASICS
-
-• **10 min – Game Plan Kick‑Off**  
-  ○ Skim this schedule and set a mini‑goal for today.  
-  ○ Tool: 3‑Day Plan page  
-
-• **20 min – Chat with the AI Tutor**  
-  ○ Ask: “What mistakes do first‑time drivers make most?”  
-  ○ Get quick, teen‑friendly explanations.  
-
-• **25 min – General Quiz Attack**  
-  ○ Go to _Practice Quiz → General_.  
-  ○ Discover what you already know (or don’t).  
-
-• **15 min – Traffic Signals Flashcards**  
-  ○ Flashcards → Traffic Signals to lock in light colors & arrow shapes.  
-
-• **5 min – Progress Check‑In**  
-  ○ Enter today’s quiz score in _Progress Tracker_.  
-  ○ Jot one topic that felt tough—AI Tutor will focus on it tomorrow.  
-
----
-
-### DAY 2 – DIAL IN THE DETAILS
-
-• **10 min – Road Signs Warm‑Up**  
-  ○ Flashcards → Road Signs (speedy picture‑memory boost).  
-
-• **20 min – Rapid‑Fire Q&A**  
-  ○ AI Tutor: “Give me 5 tips to remember right‑of‑way rules.”  
-
-• **25 min – Right‑of‑Way Quiz**  
-  ○ Practice Quiz → Right of Way.  
-  ○ Put those fresh tips to the test.  
-
-• **15 min – Speed Limits Flashcards**  
-  ○ Flashcards → Speed Limits to nail the numbers.  
-
-• **10 min – Progress Tracker Update**  
-  ○ Mark new scores, celebrate streaks, spot weak points.  
-
-• **Evening Mini‑Challenge (Optional 10 min)**  
-  ○ Re‑take yesterday’s General Quiz and beat your score.  
-
----
-
-### DAY 3 – GAME‑DAY SIMULATION
-
-• **15 min – Flashcard Fix‑Up**  
-  ○ Hit any topic where you’re under 80 %. Lightning review.  
-
-• **35 min – Full‑Length Mock Quiz**  
-  ○ Practice Quiz → General. Do it twice back‑to‑back for real‑test stamina.  
-
-• **15 min – Last‑Minute AI Tutor Grill‑Session**  
-  ○ Ask: “Quiz me on 10 tricky alcohol‑law questions.”  
-  ○ Get instant correction & tips.  
-
-• **5 min – Final Progress High‑Five**  
-  ○ Open _Progress Tracker_, admire the glow‑up, and breathe. You’re ready!  
-
----
-
-### PRO TIPS
-
-• **Chunk it → Check it:** tick off each block in Progress Tracker for a mini dopamine hit.  
-• **Speak answers out loud:** saying flashcard answers cements memory.  
-• **Move & hydrate:** quick stretch or sip of water between blocks keeps your brain sharp.  
-• **Use “Explain like I’m 14”:** anytime you’re lost, type this to the AI Tutor for a simpler breakdown.  
-
-Stick to the plan, trust the tools, and you’ll cruise through the SC permit test. **You got this!** 🚗💨
-"""
-
-    st.markdown(plan)
-    st.download_button("Download PDF", create_pdf(plan), file_name="study_plan.pdf")
-# === Progress Tracker ===
-elif menu == "Progress Tracker":
-    st.header("Your Progress")
-    user_id = user.id
-    response = supabase.table("quiz_scores").select("*").eq("user_id", user_id).execute()
-    progress = response.data if response else []
-    if progress:
-        # Group attempts by date for daily accuracy
-        from collections import defaultdict
-        date_stats = defaultdict(lambda: {"correct": 0, "attempted": 0, "topics": []})
-        for entry in progress:
-            d = entry["date"]
-            date_stats[d]["correct"] += entry["correct"]
-            date_stats[d]["attempted"] += entry["attempted"]
-            date_stats[d]["topics"].append(f'{entry["topic"]} — {entry["correct"]}/{entry["attempted"]} correct')
-        # Display each day's stats and accuracy
-        for d in sorted(date_stats.keys(), reverse=True):
-            topics_str = "<br>".join(date_stats[d]["topics"])
-            accuracy = (
-                (date_stats[d]["correct"] / date_stats[d]["attempted"]) * 100
-                if date_stats[d]["attempted"] else 0
+                timings = {}
+                try:
+                    with st.chat_message("assistant"):
+                        response = st.write_stream(
+                            query_gpt_stream(
+                                chat_context.build(session.history(SYSTEM_PROMPT)),
+                                timings, user_id=user.id
+                            )
+                        )
+                except SchedulerBusy as e:
+                    session.chat.pop()   # let them ask again
+                    st.warning(str(e))
+                    st.stop()
+                except (CircuitOpen, APIError, TimeoutError) as e:
+                    # Model unavailable: fall back to the closest saved answer
+                    logger.warning("chat reply failed: %s", e)
+                    response = answer_cache.get(user_input, threshold=FALLBACK_SIMILARITY)
+                    if response is None:
+                        session.chat.pop()
+                        st.error("The tutor can't answer right now. Please try again in a minute.")
+                        st.stop()
+                    st.chat_message("assistant").write(response)
+                    st.caption("The tutor is having trouble right now, so this is a saved answer to a similar question.")
+                    cacheable = False
+                if cacheable:
+                    answer_cache.put(user_input, response)
+                logger.info(
+                    "chat reply: first token %.2fs, total %.2fs",
+                    timings.get("first_token", float("nan")), timings.get("total", float("nan"))
+                )
+            session.add_message("assistant", response)
+            session.chat_summary, session.chat_folded = chat_context.summary, chat_context.folded
+            save_session()
+        if st.button("Clear Chat"):
+            session.clear_chat()
+            save_session()
+            st.rerun()
+    # === Practice Quiz ===
+    elif menu == "Practice Quiz":
+        if not has_access:
+            st.error("Please purchase Lifetime Access to use Practice Quizzes.")
+            st.stop()
+
+        st.header("Practice Quiz")
+        st.info("For each question, select your answer. No answer is selected by default. You must answer every question to submit the quiz.")
+
+        num = st.slider("Number of Questions", 5, 10, 5)
+        topic = st.selectbox("Quiz Topic", TOPICS)
+
+        if st.button("Generate Quiz"):
+            bank = get_question_bank()
+            quiz_data = bank.draw(topic, num)
+            if not quiz_data:
+                # Bank is empty for this topic: fall back to a live call
+                try:
+                    quiz_data = generate_shared(
+                        "quiz", topic, num, QUIZ_PARSER, quiz_messages,
+                        lambda i, q: st.markdown(f"**{i}. {q['question']}**"), user.id,
+                        save=lambda items: bank.add(topic, get_near_dup_index().filter(("quiz", topic), items)),
+                    )
+                except (SchedulerBusy, CircuitOpen) as e:
+                    st.warning(str(e))
+                    st.stop()
+                except (APIError, TimeoutError) as e:
+                    logger.warning("quiz generation failed: %s", e)
+                    st.error("Quizzes can't be generated right now. Please try again in a minute.")
+                    st.stop()
+            refill_question_bank(topic)
+            session.start_quiz(quiz_data)
+            save_session()
+
+        if session.quiz is not None:
+            st.subheader("Take the Quiz")
+            quiz_data = session.quiz
+            answers = session.quiz_answers
+            before = list(answers)
+
+            for idx, q in enumerate(quiz_data):
+                label = f"{idx + 1}. {q.question}"
+                options = ["Select an answer..."] + [f"{key}. {val}" for key, val in q.lettered()]
+                # Preselect a saved answer, e.g. after a reload
+                saved = "ABCD".find(answers[idx] or "?") + 1
+                selected = st.radio(label, options, key=f"q_{idx}", index=saved)
+                answers[idx] = selected[0] if selected != "Select an answer..." else None
+            all_answered = None not in answers
+            if answers != before:
+                save_session()
+
+            if st.button("Submit Quiz", disabled=not all_answered):
+                session.quiz_submitted = True
+                save_session()
+                correct = sum(1 for q, answer in zip(quiz_data, answers) if answer == q.answer)
+                save_score(user.id, topic, correct, len(quiz_data))
+                st.success(f"You got {correct} out of {len(quiz_data)} correct!")
+                st.markdown("**Correct Answers:**")
+                for i, q in enumerate(quiz_data):
+                    st.markdown(f"- Question {i+1}: {q.answer}")
+
+    # === Flashcards ===
+    elif menu == "Flashcards":
+        if not has_access:
+            st.error("Please purchase Lifetime Access to use Flashcards.")
+            st.stop()
+
+        st.header("Flashcards")
+        st.info("Cards you find hard come back sooner; ones you know well wait longer. Grade each card after revealing it.")
+        topic = st.selectbox("Flashcard Topic", [ALL_TOPICS, *TOPICS])
+        store = get_card_store()
+
+        if st.button("Start Review"):
+            topics = None if topic == ALL_TOPICS else [topic]
+            deck = store.due(user.id, REVIEW_SESSION_SIZE, topics)
+            if len(deck) < REVIEW_SESSION_SIZE:
+                # Not enough due cards: top up with new ones
+                try:
+                    deck += new_flashcards(
+                        user.id, topics, REVIEW_SESSION_SIZE - len(deck), generate=len(deck) < SHORT_QUEUE
+                    )
+                except (SchedulerBusy, CircuitOpen) as e:
+                    if not deck:
+                        st.warning(str(e))
+                        st.stop()
+                except (APIError, TimeoutError) as e:
+                    logger.warning("flashcard generation failed: %s", e)
+                    if not deck:
+                        st.error("Flashcards can't be generated right now. Please try again in a minute.")
+                        st.stop()
+            session.start_flashcards(deck)
+            save_session()
+
+        if session.flashcards is not None:
+            st.subheader(f"{topic} Flashcards")
+
+            for idx, card in enumerate(session.flashcards):
+                st.markdown(f"**Q{idx+1}: {card.question}**")
+                if not session.revealed[idx]:
+                    if st.button("Reveal Answer", key=f"reveal_btn_{idx}"):
+                        session.revealed[idx] = True
+                        save_session()
+
+                if session.revealed[idx]:
+                    st.success(f"**A{idx+1}: {card.answer}**")
+                    if session.graded[idx]:
+                        st.caption(f"Next review: {session.graded[idx]}")
+                    else:
+                        for col, (label, grade) in zip(st.columns(len(GRADES)), GRADES.items()):
+                            if col.button(label, key=f"grade_{idx}_{label}"):
+                                due = store.review(user.id, card.card_id, grade)
+                                session.graded[idx] = datetime.datetime.fromtimestamp(due).strftime("%b %d, %H:%M")
+                                save_session()
+                                st.rerun()
+                st.write("---")
+
+            # Download option
+            flashcard_text = "\n\n".join(
+                [f"Q{idx+1}: {c.question}\nA{idx+1}: {c.answer}" 
+                 for idx, c in enumerate(session.flashcards)]
             )
-            st.markdown(
-                f"**{d}**<br>{topics_str}<br>"
-                f"<span style='color: #666;'>Daily Accuracy: <b>{accuracy:.1f}%</b></span><br><br>",
-                unsafe_allow_html=True,
+            st.download_button(
+                "Download PDF", create_pdf(flashcard_text), file_name="flashcards.pdf"
             )
-        # Compute total accuracy
-        total_correct = sum(x["correct"] for x in progress)
-        total_attempted = sum(x["attempted"] for x in progress)
-        if total_attempted:
-            accuracy = (total_correct / total_attempted) * 100
-            st.metric("Total Accuracy", f"{accuracy:.1f}%")
-    else:
-        st.info("No progress saved yet.")
+
+    # === Study Plan ===
+    elif menu == "Study Plan":
+        st.header("3-Day Study Plan")
+
+        st.markdown(STUDY_PLAN)
+        st.download_button("Download PDF", study_plan_pdf(), file_name="study_plan.pdf")
+    # === Progress Tracker ===
+    elif menu == "Progress Tracker":
+        st.header("Your Progress")
+        user_id = user.id
+        # Reads only the rollup tables, so cost tracks the days shown,
+        # not the number of quizzes ever taken
+        with span("supabase.progress_topics"):
+            topic_rows = progress_rpc("progress_topics", p_user_id=user_id)
+        if topic_rows:
+            total_correct = sum(x["correct"] for x in topic_rows)
+            total_attempted = sum(x["attempted"] for x in topic_rows)
+            if total_attempted:
+                accuracy = (total_correct / total_attempted) * 100
+                st.metric("Total Accuracy", f"{accuracy:.1f}%")
+
+            st.subheader("Accuracy by Topic")
+            for x in sorted(topic_rows, key=lambda r: r["correct"] / r["attempted"] if r["attempted"] else 0):
+                topic_acc = (x["correct"] / x["attempted"]) * 100 if x["attempted"] else 0
+                st.markdown(f'- **{x["topic"]}** — {x["correct"]}/{x["attempted"]} correct ({topic_acc:.1f}%)')
+
+            st.subheader("Daily History")
+            page = session.progress_page
+            start = page * PROGRESS_DAYS_PER_PAGE
+            # Fetch one extra day to know whether an older page exists
+            with span("supabase.progress_days"):
+                days = progress_rpc(
+                    "progress_days", p_user_id=user_id, p_offset=start, p_limit=PROGRESS_DAYS_PER_PAGE + 1
+                )
+            has_older = len(days) > PROGRESS_DAYS_PER_PAGE
+            days = days[:PROGRESS_DAYS_PER_PAGE]
+            day_topics = defaultdict(list)
+            if days:
+                with span("supabase.progress_day_topics"):
+                    rows = progress_rpc(
+                        "progress_day_topics", p_user_id=user_id, p_dates=[d["date"] for d in days]
+                    )
+                for entry in rows:
+                    day_topics[entry["date"]].append(
+                        f'{entry["topic"]} — {entry["correct"]}/{entry["attempted"]} correct'
+                    )
+            # Display each day's stats and accuracy
+            for d in days:
+                topics_str = "<br>".join(sorted(day_topics[d["date"]]))
+                accuracy = (d["correct"] / d["attempted"]) * 100 if d["attempted"] else 0
+                st.markdown(
+                    f"**{d['date']}**<br>{topics_str}<br>"
+                    f"<span style='color: #666;'>Daily Accuracy: <b>{accuracy:.1f}%</b></span><br><br>",
+                    unsafe_allow_html=True,
+                )
+            newer_col, older_col = st.columns(2)
+            if page > 0 and newer_col.button("← Newer days"):
+                session.progress_page = page - 1
+                save_session()
+                st.rerun()
+            if has_older and older_col.button("Older days →"):
+                session.progress_page = page + 1
+                save_session()
+                st.rerun()
+        else:
+            st.info("No progress saved yet.")
+finally:
+    # Pages that end in st.stop() or st.rerun() are timed too
+    page_timer.finish()
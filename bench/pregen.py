@@ -0,0 +1,75 @@
+"""End-to-end run of pregenerate.py against the local OpenAI stub.
+
+    python -m bench.pregen
+
+Generates a small pack, damages its tail the way a crash mid-write would,
+resumes with higher targets, and checks that the result loads into a
+question bank and flashcard pool with every item valid and no topic over
+its target.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+
+from bench.stubs import OpenAIHandler, StubServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quiz", type=int, default=40, help="quiz questions per topic (final run)")
+    parser.add_argument("--flashcards", type=int, default=20, help="flashcards per topic (final run)")
+    parser.add_argument("--openai-latency-ms", type=float, default=50)
+    parser.add_argument("--rpm", type=int, default=6000)
+    args = parser.parse_args(argv)
+
+    stub = StubServer(OpenAIHandler, args.openai_latency_ms / 1000).start()
+    os.environ.update({"OPENAI_API_KEY": "sk-bench", "OPENAI_BASE_URL": stub.url + "/v1"})
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    import pregenerate
+    from question_bank import QuestionBank, validate_question
+    from spaced_repetition import CardStore
+
+    workdir = tempfile.mkdtemp(prefix="dmv-pregen-")
+    out = os.path.join(workdir, "pack.jsonl.gz")
+    common = ["--out", out, "--rpm", str(args.rpm)]
+
+    first = pregenerate.main(common + ["--quiz", str(args.quiz // 2), "--flashcards", str(args.flashcards // 2)])
+    with open(out, "ab") as f:
+        f.write(b"\x1f\x8b\x08\x00half-written batch")
+    start = time.perf_counter()
+    second = pregenerate.main(common + ["--quiz", str(args.quiz), "--flashcards", str(args.flashcards)])
+    resumed_in = time.perf_counter() - start
+
+    counts = Counter()
+    invalid = 0
+    bank = QuestionBank(os.path.join(workdir, "bank.db"))
+    cards = CardStore(os.path.join(workdir, "cards.db"))
+    for kind, topic, item in pregenerate.read_pack(out):
+        counts[(kind, topic)] += 1
+        if kind == "quiz":
+            invalid += not validate_question(item)
+            bank.add(topic, [item])
+        else:
+            cards.add_cards(topic, [item])
+
+    targets = {"quiz": args.quiz, "flashcards": args.flashcards}
+    over = [part for part, n in counts.items() if n > targets[part[0]]]
+    print(f"\nPack: {os.path.getsize(out)} bytes, {sum(counts.values())} items, "
+          f"{first['requests']} + {second['requests']} requests, resumed run {resumed_in:.2f}s")
+    print(f"Question bank: {sum(bank.count(t) for t in pregenerate.TOPICS)} questions; "
+          f"flashcard pool: {cards.stats()['cards']} cards")
+    ok = not invalid and not over and all(
+        counts[(kind, t)] == targets[kind] for kind in targets for t in pregenerate.TOPICS
+    )
+    print("OK" if ok else f"FAILED: invalid={invalid} over_target={over} counts={dict(counts)}")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,221 @@
+"""Offline load and latency benchmark for app.py.
+
+Starts local stubs for OpenAI, Supabase and Stripe (see stubs.py), points
+the app at them through environment variables, and drives scripted
+sessions (login -> chat -> quiz -> submit -> progress) through Streamlit's
+AppTest at rising concurrency. Reports p50/p95/p99 rerun latency per page,
+plus the external calls each page makes.
+
+    python -m bench.run --concurrency 1 4 16 --openai-latency-ms 300
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from bench.stubs import SERVICE_ROLE_KEY, start_stubs, user_id_for
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP = os.path.join(ROOT, "app.py")
+
+
+def serialize_script_compiles():
+    # CPython 3.11's ast.parse is not safe to call from several threads at
+    # once, and every AppTest compiles app.py on its own
+    from streamlit.runtime.scriptrunner import magic
+
+    lock = threading.Lock()
+    add_magic = magic.add_magic
+
+    def locked_add_magic(*args, **kwargs):
+        with lock:
+            return add_magic(*args, **kwargs)
+
+    magic.add_magic = locked_add_magic
+
+
+def configure_env(stubs, workdir):
+    os.environ.update({
+        "OPENAI_API_KEY": "sk-bench",
+        "OPENAI_BASE_URL": stubs["openai"].url + "/v1",
+        "SUPABASE_URL": stubs["supabase"].url,
+        "SUPABASE_ANON_KEY": "anon-bench",
+        "SUPABASE_SERVICE_ROLE_KEY": SERVICE_ROLE_KEY,
+        "STRIPE_SECRET_KEY": "sk_test_bench",
+        "STRIPE_API_BASE": stubs["stripe"].url,
+        "STRIPE_PRICE_ID": "price_bench",
+        "STRIPE_SUCCESS_URL": "http://localhost/success",
+        "STRIPE_CANCEL_URL": "http://localhost/cancel",
+        "QUESTION_BANK_PATH": os.path.join(workdir, "question_bank.db"),
+        "FULFILLMENT_DB": os.path.join(workdir, "fulfillment.db"),
+        "FLASHCARD_DB": os.path.join(workdir, "flashcards.db"),
+        "PREGENERATED_PATH": os.path.join(workdir, "pregenerated.jsonl.gz"),
+        "SESSION_DB": os.path.join(workdir, "sessions.db"),
+    })
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+
+
+def _button(at, label):
+    return next(b for b in at.button if b.label == label)
+
+
+def session_steps(at, email):
+    """(page, action) pairs for one scripted user session."""
+    def login():
+        at.text_input[0].input(email)
+        at.text_input[1].input("bench-password")
+        _button(at, "Log In").click()
+
+    def answer_quiz():
+        for radio in at.radio:
+            if radio.key and radio.key.startswith("q_"):
+                radio.set_value(radio.options[1])
+
+    return [
+        ("login", lambda: None),
+        ("login", login),
+        ("chat", lambda: at.sidebar.radio[0].set_value("Tutor Chat")),
+        ("chat", lambda: at.chat_input[0].set_value("Who has the right of way at a 4-way stop?")),
+        ("quiz", lambda: at.sidebar.radio[0].set_value("Practice Quiz")),
+        ("quiz", lambda: _button(at, "Generate Quiz").click()),
+        ("quiz", answer_quiz),
+        ("quiz", lambda: _button(at, "Submit Quiz").click()),
+        ("progress", lambda: at.sidebar.radio[0].set_value("Progress Tracker")),
+    ]
+
+
+def run_session(email, timeout, stubs=None, calls=None):
+    """Run one scripted session; returns [(page, seconds), ...].
+
+    With ``stubs`` and ``calls``, external calls made by each step are added
+    to ``calls[page]`` (only meaningful when nothing else is running), and
+    the Progress Tracker is checked to show the submitted quiz.
+    """
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(APP, default_timeout=timeout)
+    timings = []
+    for page, action in session_steps(at, email):
+        before = _snapshot(stubs) if stubs else None
+        action()
+        start = time.perf_counter()
+        at.run()
+        timings.append((page, time.perf_counter() - start))
+        if at.exception:
+            raise RuntimeError(f"{page}: {at.exception[0].message}")
+        if stubs:
+            calls[page].update(_snapshot(stubs) - before)
+    if stubs:
+        check_progress(at, stubs, email, timeout)
+    return timings
+
+
+def check_progress(at, stubs, email, timeout):
+    """Fail unless the Progress Tracker (the last page of the session) shows
+    the quiz score. Scores are written behind, so wait for the row first."""
+    store = stubs["supabase"].store
+    user_id = user_id_for(email)
+    deadline = time.monotonic() + timeout
+    while not any(r["user_id"] == user_id for r in store.tables["quiz_scores"]):
+        if time.monotonic() > deadline:
+            raise RuntimeError("progress: quiz score was never written")
+        time.sleep(0.1)
+    at.run()
+    if not any(m.label == "Total Accuracy" for m in at.metric):
+        raise RuntimeError("progress: Progress Tracker shows no progress after a quiz")
+
+
+def _snapshot(stubs):
+    total = Counter()
+    for name, server in stubs.items():
+        total.update({f"{name}:{k}": v for k, v in server.snapshot().items()})
+    return total
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return float("nan")
+    rank = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[rank]
+
+
+def run_level(concurrency, rounds, timeout):
+    per_page = defaultdict(list)
+    errors = 0
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [
+            pool.submit(run_session, f"bench{concurrency}-{i}@example.com", timeout)
+            for i in range(concurrency * rounds)
+        ]
+        for future in futures:
+            try:
+                for page, seconds in future.result():
+                    per_page[page].append(seconds)
+            except Exception as e:
+                errors += 1
+                print(f"  session failed: {e}", file=sys.stderr)
+    return per_page, errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--rounds", type=int, default=2, help="sessions per worker at each level")
+    parser.add_argument("--openai-latency-ms", type=float, default=200)
+    parser.add_argument("--supabase-latency-ms", type=float, default=30)
+    parser.add_argument("--stripe-latency-ms", type=float, default=100)
+    parser.add_argument("--timeout", type=float, default=60, help="per-rerun timeout in seconds")
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--metrics", help="write the app's Prometheus metrics to this file")
+    parser.add_argument("--traces", help="write the app's sampled traces (JSON) to this file")
+    args = parser.parse_args(argv)
+
+    stubs = start_stubs(args.openai_latency_ms / 1000, args.supabase_latency_ms / 1000,
+                        args.stripe_latency_ms / 1000)
+    workdir = tempfile.mkdtemp(prefix="dmv-bench-")
+    configure_env(stubs, workdir)
+    serialize_script_compiles()
+
+    # One quiet session first: per-page external calls, cold caches
+    calls = defaultdict(Counter)
+    run_session("bench-warmup@example.com", args.timeout, stubs, calls)
+    print("External calls per page (single cold session):")
+    for page, counter in calls.items():
+        print(f"  {page:<9} " + (", ".join(f"{k}={v}" for k, v in sorted(counter.items())) or "-"))
+
+    results = {"calls_per_page": {p: dict(c) for p, c in calls.items()}, "levels": {}}
+    print(f"\n{'conc':>4} {'page':<9} {'n':>5} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for level in args.concurrency:
+        per_page, errors = run_level(level, args.rounds, args.timeout)
+        results["levels"][level] = {"errors": errors, "pages": {}}
+        for page, values in per_page.items():
+            stats = {f"p{p}": percentile(values, p) * 1000 for p in (50, 95, 99)}
+            results["levels"][level]["pages"][page] = dict(stats, n=len(values))
+            print(f"{level:>4} {page:<9} {len(values):>5} "
+                  f"{stats['p50']:>8.1f} {stats['p95']:>8.1f} {stats['p99']:>8.1f}")
+        if errors:
+            print(f"{level:>4} {errors} session(s) failed")
+
+    totals = _snapshot(stubs)
+    results["external_calls_total"] = dict(totals)
+    print("\nExternal calls, all levels: " + ", ".join(f"{k}={v}" for k, v in sorted(totals.items())))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.metrics or args.traces:
+        import telemetry
+        if args.metrics:
+            telemetry.write_metrics(args.metrics)
+        if args.traces:
+            telemetry.dump_traces(args.traces)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,352 @@
+"""Local stand-ins for the OpenAI, Supabase and Stripe HTTP APIs.
+
+Each stub serves just enough of its API for app.py to run end to end,
+sleeps for a configurable latency before answering, and counts calls per
+endpoint so a benchmark can report external traffic.
+"""
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, handler, latency=0.0):
+        super().__init__(("127.0.0.1", 0), handler)
+        self.latency = latency
+        self.calls = Counter()
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def count(self, name):
+        with self.lock:
+            self.calls[name] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return Counter(self.calls)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        if "json" in (self.headers.get("Content-Type") or ""):
+            return json.loads(raw or b"null")
+        return {k: v[0] for k, v in parse_qs(raw.decode()).items()}
+
+    def _json(self, payload, status=200):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _delay(self):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+
+# === OpenAI chat completions ===
+_WORDS = (
+    "lane signal merge yield stop curve school zone bus cyclist pedestrian crosswalk "
+    "intersection ramp highway shoulder headlight mirror blind spot brake skid rain fog "
+    "night parking hill railroad crossing ambulance siren turn arrow flashing speed limit "
+    "following distance license permit insurance alcohol tire horn wipers seatbelt child "
+    "seat work zone cone detour median roundabout tunnel bridge truck trailer motorcycle"
+).split()
+
+
+def _phrase(n=7):
+    # Random words, so stub items aren't near-duplicates of each other
+    return " ".join(random.sample(_WORDS, n))
+
+
+def fake_completion(prompt, json_mode=False):
+    """Well-formed quiz, flashcard or chat text for a user prompt."""
+    m = re.search(r"exactly (\d+)", prompt) or re.search(r"Generate (\d+)", prompt)
+    n = int(m.group(1)) if m else 0
+    if json_mode and "multiple-choice" in prompt:
+        return json.dumps({"items": [
+            {"question": f"Stub question about {_phrase()}?",
+             "options": {"A": "One", "B": "Two", "C": "Three", "D": "Four"},
+             "answer": random.choice("ABCD")}
+            for i in range(n)
+        ]})
+    if json_mode and "flashcards" in prompt:
+        return json.dumps({"items": [
+            {"question": f"Stub card about {_phrase()}?", "answer": f"Stub answer {i}."} for i in range(n)
+        ]})
+    if "multiple-choice" in prompt:
+        return "\n\n".join(
+            f"Question {i + 1}: Stub question about {_phrase()}?\nA. One\nB. Two\nC. Three\nD. Four\n"
+            f"Answer: {random.choice('ABCD')}"
+            for i in range(n)
+        )
+    if "flashcards" in prompt:
+        return "\n".join(f"Q: Stub card about {_phrase()}?\nA: Stub answer {i}." for i in range(n))
+    return "Stop completely, then the first car to arrive goes first. Try timed practice quizzes."
+
+
+class OpenAIHandler(_Handler):
+    # Seconds between streamed chunks (on top of the server latency)
+    chunk_delay = 0.01
+
+    def do_POST(self):
+        body = self._body()
+        self.server.count("chat.completions" + (".stream" if body.get("stream") else ""))
+        self._delay()
+        text = fake_completion(body["messages"][-1]["content"], json_mode="response_format" in body)
+        usage = {"prompt_tokens": 50, "completion_tokens": len(text) // 4,
+                 "total_tokens": 50 + len(text) // 4}
+        if not body.get("stream"):
+            self._json({
+                "id": "chatcmpl-stub", "object": "chat.completion", "created": int(time.time()),
+                "model": body["model"],
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": text}}],
+                "usage": usage,
+            })
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for i in range(0, len(text), 12):
+            self._chunk({"index": 0, "delta": {"content": text[i:i + 12]}, "finish_reason": None}, body)
+            time.sleep(self.chunk_delay)
+        self._chunk({"index": 0, "delta": {}, "finish_reason": "stop"}, body)
+        if (body.get("stream_options") or {}).get("include_usage"):
+            self._write_event({"id": "chatcmpl-stub", "object": "chat.completion.chunk",
+                               "created": int(time.time()), "model": body["model"],
+                               "choices": [], "usage": usage})
+        self._write_chunk(b"data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _chunk(self, choice, body):
+        self._write_event({"id": "chatcmpl-stub", "object": "chat.completion.chunk",
+                           "created": int(time.time()), "model": body["model"], "choices": [choice]})
+
+    def _write_event(self, event):
+        self._write_chunk(f"data: {json.dumps(event)}\n\n".encode())
+
+    def _write_chunk(self, data):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+
+# === Supabase auth + PostgREST ===
+SERVICE_ROLE_KEY = "service-bench"
+# Tables whose RLS policy is auth.uid() = user_id
+RLS_TABLES = {"quiz_daily_rollups", "quiz_daily_topic_rollups", "quiz_topic_rollups"}
+
+
+class SupabaseHandler(_Handler):
+    """In-memory PostgREST subset: eq/in filters, order, limit/offset,
+    insert and upsert, and the progress functions. Inserts into quiz_scores
+    update the rollup tables the same way the database trigger does.
+
+    Row-level security on the rollup tables is enforced like Supabase does:
+    the service-role key sees every row, a user's access token only their
+    own, and the anon key none."""
+
+    def _caller(self):
+        """The caller's role: "service", a user id, or None for the anon key."""
+        token = (self.headers.get("Authorization") or "").removeprefix("Bearer ")
+        if token == SERVICE_ROLE_KEY:
+            return "service"
+        return token.removeprefix("stub-token.") if token.startswith("stub-token.") else None
+
+    def _table(self):
+        path = urlparse(self.path).path
+        return path.rsplit("/", 1)[-1]
+
+    def _filters(self):
+        params = parse_qs(urlparse(self.path).query)
+        filters, opts = [], {}
+        for key, values in params.items():
+            value = values[0]
+            if key in ("select", "order", "limit", "offset", "on_conflict", "columns"):
+                opts[key] = value
+            elif value.startswith("eq."):
+                filters.append((key, {unquote(value[3:])}))
+            elif value.startswith("in.("):
+                filters.append((key, {v.strip('"') for v in value[4:-1].split(",")}))
+        return filters, opts
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        if path.startswith("/auth/v1/"):
+            self._auth(path)
+            return
+        if path.startswith("/rest/v1/rpc/"):
+            self._rpc(path.rsplit("/", 1)[-1])
+            return
+        table = self._table()
+        self.server.count(f"rest.insert.{table}")
+        self._delay()
+        rows = self._body()
+        rows = rows if isinstance(rows, list) else [rows]
+        prefer = self.headers.get("Prefer") or ""
+        upsert = "merge" if "merge-duplicates" in prefer else "ignore" if "ignore-duplicates" in prefer else None
+        on_conflict = self._filters()[1].get("on_conflict")
+        self.server.store.insert(table, rows, upsert=upsert, on_conflict=on_conflict)
+        self._json(rows, status=201)
+
+    def do_PATCH(self):
+        self.do_POST()
+
+    def do_GET(self):
+        table = self._table()
+        self.server.count(f"rest.select.{table}")
+        self._delay()
+        filters, opts = self._filters()
+        caller = self._caller()
+        if table in RLS_TABLES and caller != "service":
+            filters.append(("user_id", {caller} if caller else set()))
+        self._json(self.server.store.select(table, filters, opts))
+
+    def _rpc(self, name):
+        self.server.count(f"rpc.{name}")
+        self._delay()
+        if self._caller() != "service":
+            # Execute is granted to service_role only
+            self._json({"code": "42501", "message": f"permission denied for function {name}"}, status=403)
+            return
+        args = self._body() or {}
+        user = [("user_id", {args["p_user_id"]})]
+        store = self.server.store
+        if name == "progress_topics":
+            rows = store.select("quiz_topic_rollups", user, {})
+        elif name == "progress_days":
+            rows = store.select("quiz_daily_rollups", user, {
+                "order": "date.desc", "offset": args["p_offset"], "limit": args["p_limit"],
+            })
+        elif name == "progress_day_topics":
+            rows = store.select("quiz_daily_topic_rollups", user + [("date", set(args["p_dates"]))], {})
+        else:
+            self._json({"code": "PGRST202", "message": f"function {name} not found"}, status=404)
+            return
+        self._json(rows)
+
+    def _auth(self, path):
+        self.server.count("auth." + path.rsplit("/", 1)[-1])
+        self._delay()
+        body = self._body() or {}
+        email = body.get("email", "bench@example.com")
+        user = {
+            "id": user_id_for(email), "aud": "authenticated",
+            "role": "authenticated", "email": email, "app_metadata": {}, "user_metadata": {},
+            "created_at": "2024-01-01T00:00:00Z",
+        }
+        self._json({
+            "access_token": "stub-token." + user["id"], "token_type": "bearer", "expires_in": 3600,
+            "expires_at": int(time.time()) + 3600, "refresh_token": "stub-refresh", "user": user,
+        })
+
+
+def user_id_for(email):
+    """The id the auth stub gives the user signing in as ``email``."""
+    return str(uuid.uuid5(uuid.NAMESPACE_DNS, email))
+
+
+class MemoryStore:
+    def __init__(self, paid_users=True):
+        self.paid_users = paid_users
+        self.tables = defaultdict(list)
+        self.lock = threading.Lock()
+
+    def insert(self, table, rows, upsert=None, on_conflict=None):
+        """``upsert`` is None, "merge" or "ignore"; conflicts are matched on
+        the comma-separated ``on_conflict`` columns (the whole row if unset)."""
+        with self.lock:
+            for row in rows:
+                if upsert:
+                    keys = on_conflict.split(",") if on_conflict else list(row)
+                    match = next((r for r in self.tables[table] if all(r.get(k) == row.get(k) for k in keys)), None)
+                    if match is not None:
+                        if upsert == "merge":
+                            match.update(row)
+                        continue
+                self.tables[table].append(dict(row))
+                if table == "quiz_scores":
+                    self._rollup(row)
+
+    def _rollup(self, row):
+        for table, keys in (
+            ("quiz_daily_rollups", ("user_id", "date")),
+            ("quiz_daily_topic_rollups", ("user_id", "date", "topic")),
+            ("quiz_topic_rollups", ("user_id", "topic")),
+        ):
+            match = next((r for r in self.tables[table] if all(r[k] == row[k] for k in keys)), None)
+            if match is None:
+                match = {k: row[k] for k in keys} | {"correct": 0, "attempted": 0, "quizzes": 0}
+                self.tables[table].append(match)
+            match["correct"] += row["correct"]
+            match["attempted"] += row["attempted"]
+            match["quizzes"] += 1
+
+    def select(self, table, filters, opts):
+        if table == "user_access" and self.paid_users:
+            # Every bench user has bought access
+            return [{"user_id": v} for k, vals in filters if k == "user_id" for v in vals]
+        with self.lock:
+            rows = [r for r in self.tables[table]
+                    if all(str(r.get(k)) in vals for k, vals in filters)]
+        if "order" in opts:
+            col, _, direction = opts["order"].partition(".")
+            rows.sort(key=lambda r: r.get(col), reverse=direction.startswith("desc"))
+        offset = int(opts.get("offset", 0))
+        limit = int(opts["limit"]) if "limit" in opts else None
+        return rows[offset:offset + limit if limit is not None else None]
+
+
+# === Stripe checkout ===
+class StripeHandler(_Handler):
+    def do_POST(self):
+        self.server.count("checkout.sessions.create")
+        self._delay()
+        form = self._body()
+        sid = "cs_test_" + uuid.uuid4().hex
+        self._json(self._session(sid, form.get("metadata[user_id]", ""), "unpaid"))
+
+    def do_GET(self):
+        self.server.count("checkout.sessions.retrieve")
+        self._delay()
+        sid = urlparse(self.path).path.rsplit("/", 1)[-1]
+        self._json(self._session(sid, "", "paid"))
+
+    @staticmethod
+    def _session(sid, user_id, status):
+        return {"id": sid, "object": "checkout.session", "payment_status": status,
+                "url": f"https://checkout.stripe.test/{sid}", "metadata": {"user_id": user_id}}
+
+
+def start_stubs(openai_latency=0.0, supabase_latency=0.0, stripe_latency=0.0):
+    """Start all three stubs; returns a dict of running servers."""
+    openai = StubServer(OpenAIHandler, openai_latency).start()
+    supabase = StubServer(SupabaseHandler, supabase_latency)
+    supabase.store = MemoryStore()
+    supabase.start()
+    stripe = StubServer(StripeHandler, stripe_latency).start()
+    return {"openai": openai, "supabase": supabase, "stripe": stripe}
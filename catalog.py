@@ -0,0 +1,154 @@
+"""Topic catalog and generation prompts.
+
+Shared by the app and the bulk pre-generation CLI (pregenerate.py), so
+both ask for the same content in the same format.
+"""
+import os
+
+from fanout import shard_sizes
+from stream_parse import FlashcardJsonParser, FlashcardStreamParser, QuizJsonParser, QuizStreamParser
+
+# === System Prompts ===
+# Tutor Chat
+SYSTEM_PROMPT = (
+    "You are a certified South Carolina DMV Permit Test Tutor specializing in helping teenagers "
+    "prepare for their written learner’s permit exam.\n\n"
+    "Your job is to clearly explain driving laws, road signs, traffic rules, and safety principles "
+    "using only the information found in:\n"
+    "- The South Carolina Driver’s Manual (2024 edition), and\n"
+    "- The official SC DMV Practice Test: https://practice.dmv-test-pro.com/south-carolina/sc-permit-practice-test-19/\n\n"
+    "Key instructions:\n"
+    "- ONLY use facts found in the manual or practice test.\n"
+    "- DO NOT make up laws, facts, or explanations.\n"
+    "- Use language appropriate for 15- to 17-year-olds.\n"
+    "- When creating a quiz, strictly follow this format:\n"
+    "Question 1: [question text]\n"
+    "A. [option A]\n"
+    "B. [option B]\n"
+    "C. [option C]\n"
+    "D. [option D]\n"
+    "Answer: [A/B/C/D]\n\n"
+    "- Start each question with 'Question [number]:'.\n"
+    "- Return EXACTLY N questions in the specified format.\n"
+    "- DO NOT include explanations, hints, or any extra text.\n"
+    "- Make sure all questions are unique and properly numbered.\n\n"
+    "- When creating flashcards, strictly follow this format:\n"
+    "Q: [question]\nA: [answer]\n"
+    "- Return exactly 10 Q/A flashcards and nothing else. No numbering, no MCQ, no explanations, no commentary.\n\n"
+    "**Failure to follow these instructions will result in broken output.**"
+        "\n\n"
+    "Proactive guidance:\n"
+    "- After answering the user's question, briefly suggest ONE effective test‑taking or study strategy (e.g. spaced repetition, practice under timed conditions).\n"
+    "- Then, recommend a relevant feature of this website (Practice Quiz, Flashcards, Study Plan, or Progress Tracker) and explain in one sentence how using it will help them master the permit test faster.\n"
+    "- Keep the tip + recommendation to a total of **two sentences** so it doesn't feel spammy."
+)
+
+# Quiz and flashcard generation: content rules only. The output format is
+# in each request, so the chat prompt's text formats and tips don't apply.
+GENERATION_PROMPT = (
+    "You write South Carolina DMV learner's permit practice material for teenagers (15 to 17).\n"
+    "- ONLY use facts found in the South Carolina Driver's Manual (2024 edition) and the official SC DMV practice test.\n"
+    "- DO NOT make up laws, facts, or numbers.\n"
+    "- Keep wording clear and age-appropriate, and make every item test a different fact.\n"
+    "- Follow the output format in the request exactly, with no extra text."
+)
+
+
+
+# === Topics, with sub-topics used to spread fan-out shards across a topic ===
+SUBTOPICS = {
+    "General": ["licensing and permit rules", "safe driving habits", "road signs and signals", "sharing the road"],
+    "Road Signs": ["regulatory signs", "warning signs", "guide and service signs", "sign shapes and colors"],
+    "Right of Way": ["intersections and 4-way stops", "pedestrians and cyclists", "emergency vehicles and school buses", "merging and turning"],
+    "Alcohol Laws": ["BAC limits and zero tolerance", "implied consent", "penalties and suspensions", "effects of alcohol and drugs"],
+    "Speed Limits": ["posted and default limits", "school and work zones", "adjusting for conditions", "following distance"],
+    "Traffic Signals": ["signal lights and arrows", "flashing signals", "lane markings", "railroad crossings"],
+}
+TOPICS = tuple(SUBTOPICS)
+
+
+def shard_focuses(topic, count):
+    subtopics = SUBTOPICS.get(topic) or [None]
+    return [subtopics[i % len(subtopics)] for i in range(count)]
+
+
+def focus_line(focus):
+    return f"Focus on this part of the topic: {focus}. " if focus else ""
+
+
+# === Structured (JSON) output for quizzes and flashcards ===
+# STRUCTURED_OUTPUT=0 switches back to the plain-text line format
+STRUCTURED_OUTPUT = os.environ.get("STRUCTURED_OUTPUT", "1") != "0"
+RESPONSE_FORMAT = {"type": "json_object"} if STRUCTURED_OUTPUT else None
+QUIZ_PARSER = QuizJsonParser if STRUCTURED_OUTPUT else QuizStreamParser
+FLASHCARD_PARSER = FlashcardJsonParser if STRUCTURED_OUTPUT else FlashcardStreamParser
+# Stems listed in a top-up prompt so the model doesn't repeat them
+MAX_AVOID = 20
+
+
+def avoid_line(avoid):
+    avoid = list(avoid)[-MAX_AVOID:]
+    return ("Do not repeat any of these questions: " + " | ".join(avoid) + " ") if avoid else ""
+
+
+# === Quiz prompt ===
+def quiz_messages(topic, num, focus=None, avoid=()):
+    if STRUCTURED_OUTPUT:
+        fmt = (
+            "Return only a JSON object of the form "
+            '{"items": [{"question": "...", "options": {"A": "...", "B": "...", "C": "...", "D": "..."}, "answer": "A"}]}. '
+            "Every question needs exactly four options A-D, one correct answer letter, and a stem not used by any other question."
+        )
+    else:
+        fmt = (
+            "Each must follow this format:\n"
+            "Question 1: [question]\n"
+            "A. [option A]\n"
+            "B. [option B]\n"
+            "C. [option C]\n"
+            "D. [option D]\n"
+            "Answer: [correct option letter]\n\n"
+            "Return ONLY the questions — no explanations, no commentary, no extra text. "
+            "Number all questions correctly and provide the correct answer for each."
+        )
+    prompt = (
+        f"Generate exactly {num} multiple-choice questions for the topic '{topic}' from the South Carolina DMV permit test. "
+        + focus_line(focus) + avoid_line(avoid) + fmt
+    )
+    return [
+        {"role": "system", "content": GENERATION_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+
+
+# === Flashcard prompt ===
+def flashcard_messages(topic, num=10, focus=None, avoid=()):
+    if STRUCTURED_OUTPUT:
+        fmt = (
+            "Each flashcard should have a clear question and a short, clear answer. "
+            'Return only a JSON object of the form {"items": [{"question": "...", "answer": "..."}]}, '
+            "with no multiple choice and no repeated questions."
+        )
+    else:
+        fmt = (
+            "Each flashcard should have a clear question and a short, clear answer. "
+            "Use exactly this format for each flashcard: Q: [question]\nA: [answer]\n"
+            "Return ONLY flashcards, no extra text, no multiple choice, and no explanations."
+        )
+    prompt = (
+        f"Generate exactly {num} flashcards for the topic '{topic}' using a Q&A format only from the SC permit test. "
+        + focus_line(focus) + avoid_line(avoid) + fmt
+    )
+    return [
+        {"role": "system", "content": GENERATION_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+
+
+# === Split a large request into concurrent shards ===
+def shard_messages(make_messages, topic, num, avoid=()):
+    sizes = shard_sizes(num)
+    return [
+        make_messages(topic, size, focus, avoid)
+        for size, focus in zip(sizes, shard_focuses(topic, len(sizes)))
+    ]
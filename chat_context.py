@@ -0,0 +1,82 @@
+import math
+from functools import lru_cache
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:  # tiktoken is optional; fall back to a rough estimate
+    _encoding = None
+
+# Tokens the API adds around every message (role, separators)
+MESSAGE_OVERHEAD = 4
+# After folding, trim the window to this share of the budget so we don't
+# have to re-summarize on every turn
+FOLD_TARGET = 0.75
+
+
+@lru_cache(maxsize=4096)
+def count_tokens(text):
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return math.ceil(len(text) / 4)
+
+
+def message_tokens(msg):
+    return count_tokens(msg["content"]) + MESSAGE_OVERHEAD
+
+
+class ChatContext:
+    """Keeps the messages sent to the model within a token budget.
+
+    The system prompt and the most recent turns are always sent as-is.
+    Older turns are folded into a rolling summary by ``summarize``, which is
+    called as ``summarize(previous_summary, dropped_messages)`` and must
+    return the new summary text. Already-folded turns are never summarized
+    again, so the summary only grows by the turns that just fell out.
+    """
+
+    def __init__(self, summarize, budget=6000):
+        self.summarize = summarize
+        self.budget = budget
+        self.summary = ""
+        self.folded = 0
+
+    def reset(self):
+        self.summary = ""
+        self.folded = 0
+
+    def _summary_message(self):
+        return {
+            "role": "system",
+            "content": "Summary of the earlier conversation:\n" + self.summary,
+        }
+
+    def build(self, history):
+        """Return the messages to send for ``history`` (system prompt first)."""
+        system, turns = history[0], history[1:]
+        if self.folded > len(turns):
+            # History was cleared or replaced underneath us
+            self.reset()
+
+        window = turns[self.folded:]
+        fixed = message_tokens(system)
+        if self.summary:
+            fixed += message_tokens(self._summary_message())
+        cost = fixed + sum(message_tokens(m) for m in window)
+
+        if cost > self.budget:
+            target = self.budget * FOLD_TARGET
+            drop = 0
+            # Always keep the latest message, even if it alone is over budget
+            while drop < len(window) - 1 and cost > target:
+                cost -= message_tokens(window[drop])
+                drop += 1
+            if drop:
+                self.summary = self.summarize(self.summary, window[:drop])
+                self.folded += drop
+                window = window[drop:]
+
+        messages = [system]
+        if self.summary:
+            messages.append(self._summary_message())
+        return messages + window
@@ -0,0 +1,144 @@
+"""Concurrent generation of larger quizzes and flashcard sets.
+
+A request for N items is split into shards of a few items each. The shards
+run as concurrent streaming completions on the shared event loop, so total
+time is close to that of the slowest shard instead of growing with N.
+Items are yielded as soon as any shard finishes one, with duplicates
+removed.
+"""
+import asyncio
+import functools
+import queue
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from llm_scheduler import GENERATION, get_scheduler
+from resources import get_async_openai, run_async
+from telemetry import current_page, record_usage, span
+
+# Items requested per concurrent completion
+SHARD_SIZE = 3
+# Completions in flight at once for a single request
+MAX_CONCURRENCY = 4
+# Seconds a shard may take end to end before it is abandoned
+SHARD_DEADLINE = 60.0
+
+_DONE = object()
+
+
+def shard_sizes(n, shard_size=SHARD_SIZE):
+    """Split n into near-equal shards of at most shard_size (10 -> 3, 3, 2, 2)."""
+    if n <= 0:
+        return []
+    count = -(-n // shard_size)
+    base, extra = divmod(n, count)
+    return [base + 1] * extra + [base] * (count - extra)
+
+
+def item_key(item):
+    """Normalized question text, used to drop duplicates across shards."""
+    return re.sub(r"[^a-z0-9 ]", "", item["question"].lower()).strip()
+
+
+@functools.cache
+def _slot_waits():
+    """Threads for blocking scheduler waits. A dedicated pool, so queued shards
+    can't fill the loop's default executor (which also resolves hostnames)."""
+    return ThreadPoolExecutor(max_workers=get_scheduler().max_queue, thread_name_prefix="llm-slot")
+
+
+async def _acquire_slot(scheduler, user_id):
+    waiting = _slot_waits().submit(scheduler.acquire, GENERATION, user_id)
+    try:
+        await asyncio.shield(asyncio.wrap_future(waiting))
+    except asyncio.CancelledError:
+        # Cancelled while queued: hand back the slot if it's granted later
+        waiting.add_done_callback(lambda f: f.exception() is None and scheduler.release())
+        raise
+
+
+async def _run_shard(client, sem, model, messages, parser, out, page, user_id, deadline, extra, on_result):
+    scheduler = get_scheduler()
+    async with sem:
+        await _acquire_slot(scheduler, user_id)
+        try:
+            await asyncio.wait_for(_stream_shard(client, model, messages, parser, out, page, extra), deadline)
+        except Exception as e:
+            if on_result:
+                on_result(e)
+            raise
+        else:
+            if on_result:
+                on_result(None)
+        finally:
+            scheduler.release()
+
+
+async def _stream_shard(client, model, messages, parser, out, page, extra):
+    with span("openai.chat_shard", page=page, model=model):
+        stream = await client.chat.completions.create(
+            model=model, messages=messages, stream=True,
+            stream_options={"include_usage": True}, **extra,
+        )
+        async for chunk in stream:
+            if chunk.usage:
+                record_usage(model, chunk.usage, page=page)
+            if chunk.choices and chunk.choices[0].delta.content:
+                for item in parser.feed(chunk.choices[0].delta.content):
+                    out.put(item)
+    for item in parser.close():
+        out.put(item)
+
+
+async def _run_all(shards, model, concurrency, out, page, user_id, deadline, extra, on_result):
+    client = get_async_openai()
+    sem = asyncio.Semaphore(concurrency)
+    try:
+        return await asyncio.gather(
+            *(_run_shard(client, sem, model, messages, parser, out, page, user_id, deadline, extra, on_result)
+              for messages, parser in shards),
+            return_exceptions=True,
+        )
+    finally:
+        out.put(_DONE)
+
+
+def iter_fanout(message_sets, make_parser, errors=None, model="gpt-4-turbo",
+                concurrency=MAX_CONCURRENCY, exclude=(), user_id=None, deadline=SHARD_DEADLINE,
+                response_format=None, on_result=None):
+    """Run one streaming completion per entry in ``message_sets`` and yield
+    parsed items from all of them as they complete.
+
+    ``make_parser`` builds a fresh stream parser (see stream_parse.py) per
+    shard. Malformed items and failed shards are appended to ``errors``;
+    if every shard fails, the first exception is raised. ``exclude`` holds
+    item keys that should be treated as already seen. Each shard takes a
+    GENERATION slot from the LLM scheduler for ``user_id`` and is cut off
+    after ``deadline`` seconds of streaming. ``response_format`` is passed
+    through to the completion (e.g. JSON mode). ``on_result`` is called
+    with each shard's completion error, or None on success, e.g. to feed a
+    circuit breaker.
+    """
+    out = queue.Queue()
+    shards = [(messages, make_parser()) for messages in message_sets]
+    extra = {"response_format": response_format} if response_format else {}
+    future = run_async(
+        _run_all(shards, model, concurrency, out, current_page(), user_id, deadline, extra, on_result)
+    )
+    seen = set(exclude)
+    yielded = 0
+    while (item := out.get()) is not _DONE:
+        key = item_key(item)
+        if key in seen:
+            continue
+        seen.add(key)
+        yielded += 1
+        yield item
+
+    failures = [r for r in future.result() if isinstance(r, BaseException)]
+    if errors is not None:
+        for _, parser in shards:
+            errors.extend(parser.errors)
+        errors.extend({"reason": "shard failed", "text": str(e)} for e in failures)
+    if failures and not yielded:
+        raise failures[0]
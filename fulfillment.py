@@ -0,0 +1,373 @@
+"""Webhook-driven Lifetime Access fulfillment.
+
+Stripe posts ``checkout.session.completed`` events to a small webhook
+server (``python fulfillment.py serve``). Each verified event is recorded
+once in a local SQLite ledger keyed by event id and checkout session id,
+and a background thread grants ``user_access`` for pending sessions in
+batches. A failed grant is retried with backoff until it succeeds; a batch
+the database rejects is split so one bad user id can't hold up the rest,
+and the rejected purchases are marked failed. The app
+only reads the ledger at login, so it never waits on Stripe.
+
+Replay a saved event against a running server for local testing:
+
+    python fulfillment.py replay fixtures/stripe/checkout_session_completed.json
+
+Re-queue purchases that gave up under an older version and grant them now:
+
+    python fulfillment.py reconcile
+"""
+import argparse
+import hashlib
+import hmac
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger("dmv_tutor.fulfillment")
+
+# Reject signatures older than this many seconds (Stripe's default)
+SIGNATURE_TOLERANCE = 300
+# Sessions granted per user_access upsert
+GRANT_BATCH = 50
+# Seconds between grant passes
+GRANT_INTERVAL = 2.0
+# Retry a failed grant after GRANT_BACKOFF * 2**attempts seconds, capped
+GRANT_BACKOFF = 5.0
+GRANT_MAX_BACKOFF = 600.0
+# Log an error (alert) for purchases still ungranted after this many attempts
+GRANT_ALERT_ATTEMPTS = 5
+
+
+class SignatureError(Exception):
+    pass
+
+
+def is_rejected(exc):
+    """True when the database refused the rows themselves (bad uuid, missing
+    user, ...), so retrying the same grant can't succeed."""
+    code = str(getattr(exc, "code", None) or getattr(exc, "status_code", None) or "")
+    # SQLSTATE class 22 is a data exception, 23 an integrity violation
+    return code[:2] in ("22", "23") or code in ("400", "404", "409", "422")
+
+
+# === Stripe-Signature header ===
+def sign_payload(payload: bytes, secret: str, timestamp: int | None = None) -> str:
+    """Build a Stripe-Signature header for payload (used by replay)."""
+    timestamp = int(time.time()) if timestamp is None else timestamp
+    mac = hmac.new(secret.encode(), f"{timestamp}.".encode() + payload, hashlib.sha256)
+    return f"t={timestamp},v1={mac.hexdigest()}"
+
+
+def verify_signature(payload: bytes, header: str, secret: str,
+                     tolerance: int = SIGNATURE_TOLERANCE) -> None:
+    """Raise SignatureError unless header is a fresh, valid signature of payload."""
+    parts = [p.split("=", 1) for p in (header or "").split(",") if "=" in p]
+    timestamps = [v for k, v in parts if k == "t"]
+    signatures = [v for k, v in parts if k == "v1"]
+    if not timestamps or not signatures:
+        raise SignatureError("Malformed Stripe-Signature header")
+    try:
+        timestamp = int(timestamps[0])
+    except ValueError:
+        raise SignatureError("Malformed Stripe-Signature timestamp")
+    expected = hmac.new(secret.encode(), f"{timestamp}.".encode() + payload, hashlib.sha256).hexdigest()
+    if not any(hmac.compare_digest(expected, s) for s in signatures):
+        raise SignatureError("Signature does not match payload")
+    if tolerance and abs(time.time() - timestamp) > tolerance:
+        raise SignatureError("Signature timestamp outside tolerance")
+
+
+# === Ledger ===
+class Ledger:
+    """Idempotent record of paid checkout sessions and their grant status."""
+
+    def __init__(self, path="fulfillment.db"):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS purchases ("
+                " event_id TEXT PRIMARY KEY,"
+                " session_id TEXT NOT NULL UNIQUE,"
+                " user_id TEXT,"
+                " status TEXT NOT NULL DEFAULT 'pending',"
+                " attempts INTEGER NOT NULL DEFAULT 0,"
+                " error TEXT,"
+                " received_at REAL NOT NULL,"
+                " granted_at REAL,"
+                " next_attempt_at REAL NOT NULL DEFAULT 0)"
+            )
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(purchases)")}
+            if "next_attempt_at" not in columns:
+                self._conn.execute("ALTER TABLE purchases ADD COLUMN next_attempt_at REAL NOT NULL DEFAULT 0")
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS purchases_status ON purchases (status)"
+            )
+
+    def record(self, event):
+        """Store a checkout.session.completed event. Returns False for
+        duplicates (same event id or same session id) and unpaid sessions."""
+        session = event["data"]["object"]
+        if session.get("payment_status") != "paid":
+            return False
+        user_id = (session.get("metadata") or {}).get("user_id") or session.get("client_reference_id")
+        status = "pending" if user_id else "failed"
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                "INSERT OR IGNORE INTO purchases (event_id, session_id, user_id, status, error, received_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (event["id"], session["id"], user_id, status,
+                 None if user_id else "no user_id in session metadata", time.time()),
+            )
+            return cur.rowcount == 1
+
+    def pending(self, limit=GRANT_BATCH, now=None):
+        """Pending purchases that are due for a grant attempt."""
+        now = time.time() if now is None else now
+        with self._lock:
+            return self._conn.execute(
+                "SELECT session_id, user_id FROM purchases WHERE status = 'pending' AND next_attempt_at <= ?"
+                " ORDER BY received_at LIMIT ?", (now, limit)
+            ).fetchall()
+
+    def mark_granted(self, session_ids):
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE purchases SET status = 'granted', granted_at = ?, error = NULL WHERE session_id = ?",
+                [(time.time(), sid) for sid in session_ids],
+            )
+
+    def mark_attempt_failed(self, session_ids, error, now=None):
+        """Schedule the next attempt with exponential backoff; the purchases
+        stay pending. Returns the highest attempt count among them."""
+        now = time.time() if now is None else now
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE purchases SET attempts = attempts + 1, error = ?,"
+                " next_attempt_at = ? + min(?, ? * (1 << min(attempts, 20)))"
+                " WHERE session_id = ?",
+                [(str(error), now, GRANT_MAX_BACKOFF, GRANT_BACKOFF, sid) for sid in session_ids],
+            )
+            marks = ",".join("?" * len(session_ids))
+            return self._conn.execute(
+                f"SELECT max(attempts) FROM purchases WHERE session_id IN ({marks})", session_ids
+            ).fetchone()[0] or 0
+
+    def mark_failed(self, session_ids, error):
+        """Give up on purchases whose grant was rejected; reconcile re-queues them."""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE purchases SET status = 'failed', attempts = attempts + 1, error = ? WHERE session_id = ?",
+                [(str(error), sid) for sid in session_ids],
+            )
+
+    def requeue(self):
+        """Make every paid, ungranted purchase with a user due now, including
+        ones an older version marked failed. Returns how many."""
+        with self._lock, self._conn:
+            return self._conn.execute(
+                "UPDATE purchases SET status = 'pending', next_attempt_at = 0"
+                " WHERE status IN ('pending', 'failed') AND user_id IS NOT NULL"
+            ).rowcount
+
+    def status(self, session_id):
+        """(status, user_id) for a checkout session, or None if not seen yet."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT status, user_id FROM purchases WHERE session_id = ?", (session_id,)
+            ).fetchone()
+
+
+# === Batch granting ===
+class Fulfiller:
+    """Background thread that grants user_access for pending purchases."""
+
+    def __init__(self, ledger, grant_batch, interval=GRANT_INTERVAL, on_granted=None):
+        self.ledger = ledger
+        self.grant_batch = grant_batch      # called with a list of user ids
+        self.interval = interval
+        self.on_granted = on_granted
+        self.granted = 0
+        self._wake = threading.Event()
+        self._stop = False
+        self._thread = threading.Thread(target=self._run, name="fulfiller", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def notify(self):
+        """Run a grant pass now instead of waiting for the next interval."""
+        self._wake.set()
+
+    def stop(self):
+        self._stop = True
+        self._wake.set()
+        self._thread.join(10)
+
+    def _grant(self, user_ids, granted, retry, rejected):
+        """Grant user_ids, bisecting a rejected batch down to the bad users.
+        Sorts users into granted, retry (user -> error) and rejected."""
+        try:
+            self.grant_batch(user_ids)
+        except Exception as e:
+            if not is_rejected(e):
+                retry.update(dict.fromkeys(user_ids, e))
+            elif len(user_ids) == 1:
+                rejected[user_ids[0]] = e
+            else:
+                mid = len(user_ids) // 2
+                self._grant(user_ids[:mid], granted, retry, rejected)
+                self._grant(user_ids[mid:], granted, retry, rejected)
+            return
+        granted.extend(user_ids)
+
+    def run_once(self):
+        """Grant one batch of due purchases. Returns how many purchases left
+        the queue (granted or failed)."""
+        rows = self.ledger.pending()
+        if not rows:
+            return 0
+        sessions = {}
+        for sid, uid in rows:
+            sessions.setdefault(uid, []).append(sid)
+        granted, retry, rejected = [], {}, {}
+        self._grant(sorted(sessions), granted, retry, rejected)
+
+        for uid, e in rejected.items():
+            self.ledger.mark_failed(sessions[uid], e)
+            logger.error("Granting access to user %s was rejected; %d paid purchases marked failed: %s",
+                         uid, len(sessions[uid]), e)
+        if retry:
+            session_ids = [sid for uid in retry for sid in sessions[uid]]
+            e = next(iter(retry.values()))
+            attempts = self.ledger.mark_attempt_failed(session_ids, e)
+            log = logger.error if attempts >= GRANT_ALERT_ATTEMPTS else logger.warning
+            log("Granting access for %d paid purchases failed (attempt %d), will retry: %s",
+                len(session_ids), attempts, e)
+        if granted:
+            session_ids = [sid for uid in granted for sid in sessions[uid]]
+            self.ledger.mark_granted(session_ids)
+            self.granted += len(session_ids)
+            if self.on_granted:
+                self.on_granted(granted)
+        return sum(len(sessions[uid]) for uid in granted) + sum(len(sessions[uid]) for uid in rejected)
+
+    def _run(self):
+        while not self._stop:
+            while self.run_once():
+                pass
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+
+def grant_user_access(user_ids):
+    from resources import get_supabase_srv
+    get_supabase_srv().table("user_access").upsert(
+        [{"user_id": uid} for uid in user_ids], on_conflict="user_id"
+    ).execute()
+
+
+# === Webhook server ===
+def make_handler(ledger, secret, fulfiller=None):
+    class WebhookHandler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _reply(self, status, message):
+            data = json.dumps({"message": message}).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            payload = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            try:
+                verify_signature(payload, self.headers.get("Stripe-Signature"), secret)
+                event = json.loads(payload)
+            except (SignatureError, ValueError) as e:
+                self._reply(400, str(e))
+                return
+            if event.get("type") != "checkout.session.completed":
+                self._reply(200, "ignored")
+                return
+            new = ledger.record(event)
+            if new and fulfiller:
+                fulfiller.notify()
+            self._reply(200, "recorded" if new else "duplicate")
+
+    return WebhookHandler
+
+
+def serve(port, db_path, secret):
+    ledger = Ledger(db_path)
+    fulfiller = Fulfiller(ledger, grant_user_access).start()
+    server = ThreadingHTTPServer(("0.0.0.0", port), make_handler(ledger, secret, fulfiller))
+    logger.info("Listening for Stripe webhooks on :%d", port)
+    try:
+        server.serve_forever()
+    finally:
+        fulfiller.stop()
+
+
+def reconcile(db_path):
+    """Grant every paid, ungranted purchase now. Returns (requeued, granted, left)."""
+    ledger = Ledger(db_path)
+    requeued = ledger.requeue()
+    fulfiller = Fulfiller(ledger, grant_user_access)
+    while fulfiller.run_once():
+        pass
+    return requeued, fulfiller.granted, len(ledger.pending(limit=-1, now=float("inf")))
+
+
+def replay(path, url, secret):
+    """POST a saved event to a webhook server with a fresh signature."""
+    with open(path, "rb") as f:
+        payload = f.read()
+    request = urllib.request.Request(url, data=payload, method="POST", headers={
+        "Content-Type": "application/json",
+        "Stripe-Signature": sign_payload(payload, secret),
+    })
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, response.read().decode()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read().decode()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stripe webhook fulfillment")
+    parser.add_argument("--db", default=os.environ.get("FULFILLMENT_DB", "fulfillment.db"))
+    parser.add_argument("--secret", default=os.environ.get("STRIPE_WEBHOOK_SECRET"))
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_serve = sub.add_parser("serve", help="run the webhook server and batch granter")
+    p_serve.add_argument("--port", type=int, default=int(os.environ.get("WEBHOOK_PORT", "8787")))
+    p_replay = sub.add_parser("replay", help="send a saved event to a running server")
+    p_replay.add_argument("event_file")
+    p_replay.add_argument("--url", default="http://127.0.0.1:8787/stripe/webhook")
+    sub.add_parser("reconcile", help="re-queue ungranted paid purchases and grant them now")
+    args = parser.parse_args(argv)
+    if not args.secret and args.command != "reconcile":
+        parser.error("set STRIPE_WEBHOOK_SECRET or pass --secret")
+
+    logging.basicConfig(level=logging.INFO)
+    if args.command == "reconcile":
+        print(reconcile(args.db))
+    elif args.command == "serve":
+        serve(args.port, args.db, args.secret)
+    else:
+        status, body = replay(args.event_file, args.url, args.secret)
+        print(status, body)
+
+
+if __name__ == "__main__":
+    main()
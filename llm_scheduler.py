@@ -0,0 +1,153 @@
+"""Central admission control for OpenAI calls.
+
+Every LLM call takes a slot from one process-wide scheduler. At most
+``max_concurrent`` calls run at once; the rest wait in per-priority queues
+(interactive chat ahead of quiz/flashcard generation ahead of background
+refills). Within a priority, users are served round-robin so one session
+can't monopolize the slots. When the queue is already deep, new calls are
+rejected straight away with SchedulerBusy instead of piling up.
+"""
+import functools
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+import telemetry
+
+INTERACTIVE, GENERATION, BACKGROUND = 0, 1, 2
+PRIORITY_NAMES = ("interactive", "generation", "background")
+
+MAX_CONCURRENT = 8
+MAX_QUEUE = 32
+# Longest a call may wait for a slot before giving up
+MAX_WAIT = 30.0
+# Background work is turned away once the queue is this share of MAX_QUEUE
+BACKGROUND_QUEUE_SHARE = 0.25
+
+BUSY_MESSAGE = "The tutor is very busy right now. Please try again in a few seconds."
+
+
+class SchedulerBusy(Exception):
+    pass
+
+
+class _Waiter:
+    __slots__ = ("event", "granted")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.granted = False
+
+
+class LLMScheduler:
+    def __init__(self, max_concurrent=MAX_CONCURRENT, max_queue=MAX_QUEUE, max_wait=MAX_WAIT):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self._active = 0
+        self._waiting = 0
+        # One queue per priority: user -> FIFO of waiters, rotated round-robin
+        self._queues = [OrderedDict() for _ in PRIORITY_NAMES]
+        self._lock = threading.Lock()
+
+    def _queue_limit(self, priority):
+        if priority == BACKGROUND:
+            return int(self.max_queue * BACKGROUND_QUEUE_SHARE)
+        return self.max_queue
+
+    def acquire(self, priority=INTERACTIVE, user=None, timeout=None):
+        """Block until a slot is free. Raises SchedulerBusy if the queue is
+        full or no slot frees up within the timeout."""
+        start = time.perf_counter()
+        with self._lock:
+            if self._active < self.max_concurrent and not self._waiting:
+                self._active += 1
+                self.admitted += 1
+                return
+            if self._waiting >= self._queue_limit(priority):
+                self.rejected += 1
+                telemetry.inc("dmv_llm_rejected_total", priority=PRIORITY_NAMES[priority])
+                raise SchedulerBusy(BUSY_MESSAGE)
+            waiter = _Waiter()
+            self._queues[priority].setdefault(user, deque()).append(waiter)
+            self._waiting += 1
+
+        waiter.event.wait(self.max_wait if timeout is None else timeout)
+        with self._lock:
+            if not waiter.granted:
+                user_queue = self._queues[priority][user]
+                user_queue.remove(waiter)
+                if not user_queue:
+                    del self._queues[priority][user]
+                self._waiting -= 1
+                self.timed_out += 1
+                telemetry.inc("dmv_llm_rejected_total", priority=PRIORITY_NAMES[priority])
+                raise SchedulerBusy(BUSY_MESSAGE)
+            self.admitted += 1
+        telemetry.observe("dmv_llm_queue_wait_seconds", time.perf_counter() - start,
+                          priority=PRIORITY_NAMES[priority])
+
+    def try_acquire(self):
+        """Take a slot only if one is free and nobody is queued; never waits.
+        Returns whether a slot was taken."""
+        with self._lock:
+            if self._active < self.max_concurrent and not self._waiting:
+                self._active += 1
+                self.admitted += 1
+                return True
+            return False
+
+    def release(self):
+        with self._lock:
+            waiter = self._next_waiter()
+            if waiter is None:
+                self._active -= 1
+            else:
+                # Hand the slot straight to the next caller
+                waiter.granted = True
+                waiter.event.set()
+
+    def _next_waiter(self):
+        for queue in self._queues:
+            if queue:
+                user, user_queue = next(iter(queue.items()))
+                waiter = user_queue.popleft()
+                if user_queue:
+                    queue.move_to_end(user)
+                else:
+                    del queue[user]
+                self._waiting -= 1
+                return waiter
+        return None
+
+    @contextmanager
+    def slot(self, priority=INTERACTIVE, user=None):
+        self.acquire(priority, user)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "active": self._active,
+                "waiting": self._waiting,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+            }
+
+
+@functools.cache
+def get_scheduler():
+    """The process-wide scheduler (LLM_MAX_CONCURRENCY / LLM_MAX_QUEUE)."""
+    return LLMScheduler(
+        max_concurrent=int(os.environ.get("LLM_MAX_CONCURRENCY", MAX_CONCURRENT)),
+        max_queue=int(os.environ.get("LLM_MAX_QUEUE", MAX_QUEUE)),
+    )
@@ -0,0 +1,147 @@
+"""Near-duplicate detection for generated quiz questions and flashcards.
+
+Each item's text (stem plus options) is split into character shingles and
+reduced to a MinHash signature. Signatures are banded into LSH buckets, so
+a lookup only compares against items sharing a bucket instead of scanning
+the whole topic. A candidate counts as a duplicate when the estimated
+Jaccard similarity of the two signatures reaches the threshold.
+"""
+import re
+import threading
+import zlib
+from collections import defaultdict
+
+import numpy as np
+
+import telemetry
+
+NUM_PERM = 64
+BANDS = 16              # 16 bands x 4 rows: candidates from roughly 0.5 similarity
+SHINGLE_SIZE = 4
+DUPLICATE_THRESHOLD = 0.7
+
+_PRIME = (1 << 31) - 1
+
+
+def item_text(item):
+    """Stem plus options (quiz) or just the question (flashcard), normalized."""
+    text = item["question"]
+    options = item.get("options")
+    if options:
+        text += " " + " ".join(str(options[k]) for k in sorted(options))
+    return " ".join(re.sub(r"[^a-z0-9 ]", " ", text.lower()).split())
+
+
+def shingles(text, size=SHINGLE_SIZE):
+    if len(text) <= size:
+        return {text}
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+class NearDupIndex:
+    """MinHash/LSH index of item text, partitioned by ``(kind, topic)``."""
+
+    def __init__(self, threshold=DUPLICATE_THRESHOLD, num_perm=NUM_PERM, bands=BANDS, seed=1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, _PRIME, num_perm, dtype=np.uint64)[:, None]
+        self._b = rng.integers(0, _PRIME, num_perm, dtype=np.uint64)[:, None]
+        self._signatures = defaultdict(list)                       # part -> [signature]
+        self._buckets = defaultdict(lambda: [dict() for _ in range(bands)])
+        self._checked = defaultdict(int)
+        self._duplicates = defaultdict(int)
+        self._lock = threading.Lock()
+        self._seeded = threading.Event()
+        self._seeded.set()
+
+    def signature(self, text):
+        hashes = np.fromiter(
+            (zlib.crc32(s.encode()) for s in shingles(text)), dtype=np.uint64
+        )[None, :]
+        return ((self._a * hashes + self._b) % _PRIME).min(axis=1).astype(np.uint32)
+
+    def _band_keys(self, sig):
+        return [sig[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    def _match(self, part, sig, keys):
+        # Caller holds the lock
+        signatures = self._signatures[part]
+        seen = set()
+        for band, key in zip(self._buckets[part], keys):
+            for idx in band.get(key, ()):
+                if idx not in seen:
+                    seen.add(idx)
+                    if np.count_nonzero(signatures[idx] == sig) / len(sig) >= self.threshold:
+                        return True
+        return False
+
+    def _insert(self, part, sig, keys):
+        signatures = self._signatures[part]
+        signatures.append(sig)
+        for band, key in zip(self._buckets[part], keys):
+            band.setdefault(key, []).append(len(signatures) - 1)
+
+    def add(self, part, item):
+        """Index ``item`` unless it is a near-duplicate of one already in
+        ``part``. Returns True if it was added."""
+        text = item_text(item)
+        if not text:
+            return False
+        sig = self.signature(text)
+        keys = self._band_keys(sig)
+        with self._lock:
+            duplicate = self._match(part, sig, keys)
+            if not duplicate:
+                self._insert(part, sig, keys)
+        return not duplicate
+
+    def seed_in_background(self, load):
+        """Index the ``(part, item)`` pairs from ``load()`` on a background
+        thread. ``filter`` waits for them, so stored items are never missed."""
+        self._seeded.clear()
+
+        def run():
+            try:
+                for part, item in load():
+                    self.add(part, item)
+            finally:
+                self._seeded.set()
+        threading.Thread(target=run, name="near-dup-seed", daemon=True).start()
+        return self
+
+    def filter(self, part, items):
+        """The items that aren't near-duplicates of the index or of each
+        other; counts each check toward ``part``'s duplicate rate."""
+        kind, topic = part
+        self._seeded.wait()
+        kept = []
+        for item in items:
+            new = self.add(part, item)
+            with self._lock:
+                self._checked[part] += 1
+                self._duplicates[part] += not new
+            telemetry.inc("dmv_generated_items_total", kind=kind, topic=topic,
+                          result="new" if new else "near_duplicate")
+            if new:
+                kept.append(item)
+        return kept
+
+    def duplicate_rates(self):
+        """{(kind, topic): share of checked items rejected as near-duplicates}."""
+        with self._lock:
+            return {part: self._duplicates[part] / n for part, n in self._checked.items() if n}
+
+    def stats(self):
+        stats = {}
+        for (kind, topic), rate in self.duplicate_rates().items():
+            stats[re.sub(r"[^a-z0-9]+", "_", f"{kind}_{topic}".lower()) + "_duplicate_rate"] = rate
+        with self._lock:
+            stats["indexed"] = sum(len(s) for s in self._signatures.values())
+            stats["checked"] = sum(self._checked.values())
+            stats["duplicates"] = sum(self._duplicates.values())
+        stats["seeding"] = int(not self._seeded.is_set())
+        return stats
@@ -0,0 +1,120 @@
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+# Rendered PDFs kept in memory, keyed by content hash
+PDF_CACHE_SIZE = 64
+
+_cache = OrderedDict()
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0}
+
+_BULLETS = ("•", "○", "-", "*")
+# Characters the built-in Helvetica font can't draw
+_REPLACEMENTS = {"\u2011": "-", "\u2010": "-", "\u00a0": " ", "\u2192": "->", "\u25cb": "\u2013"}
+
+
+def _clean(text):
+    for src, dst in _REPLACEMENTS.items():
+        text = text.replace(src, dst)
+    # Drop anything outside the font's encoding (emoji etc.)
+    return "".join(c for c in text if c.encode("cp1252", "ignore"))
+
+
+def _escape(text):
+    return _clean(text).replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;").strip()
+
+
+def _inline(text):
+    text = _escape(text)
+    text = re.sub(r"\*\*(.+?)\*\*", r"<b>\1</b>", text)
+    text = re.sub(r"(?<!\w)_(.+?)_(?!\w)", r"<i>\1</i>", text)
+    return text
+
+
+def _paragraph(text, style, **kwargs):
+    from reportlab.platypus import Paragraph
+
+    try:
+        return Paragraph(_inline(text), style, **kwargs)
+    except ValueError:
+        # Bold and italic markers that cross (``_a **b_ c**``) nest badly;
+        # keep the text, drop the formatting
+        return Paragraph(_escape(text), style, **kwargs)
+
+
+def _flowables(text):
+    from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+    from reportlab.lib.units import inch
+    from reportlab.platypus import HRFlowable, Spacer
+
+    styles = getSampleStyleSheet()
+    headings = {1: styles["Heading1"], 2: styles["Heading2"], 3: styles["Heading3"]}
+    body = styles["BodyText"]
+    bullet_styles = [
+        ParagraphStyle(f"Bullet{level}", parent=body, leftIndent=0.25 * inch * (level + 1),
+                       bulletIndent=0.25 * inch * level, spaceBefore=1, spaceAfter=1)
+        for level in range(3)
+    ]
+
+    story = []
+    for raw in text.splitlines():
+        line = raw.strip()
+        if not line:
+            story.append(Spacer(1, 6))
+            continue
+        if re.fullmatch(r"-{3,}|\*{3,}|_{3,}", line):
+            story.append(HRFlowable(width="100%", thickness=0.5, spaceBefore=4, spaceAfter=4))
+            continue
+        heading = re.match(r"(#{1,6})\s+(.*)", line)
+        if heading:
+            level = min(len(heading.group(1)), 3)
+            story.append(_paragraph(heading.group(2), headings[level]))
+            continue
+        if line.startswith(_BULLETS) and len(line) > 1 and line[1] == " ":
+            indent = len(raw) - len(raw.lstrip())
+            level = min(indent // 2, 2)
+            bullet = "•" if line[0] != "○" else "–"
+            story.append(_paragraph(line[2:], bullet_styles[level], bulletText=bullet))
+            continue
+        story.append(_paragraph(line, body))
+    return story
+
+
+def render_pdf(text):
+    """Lay out markdown-ish text (headings, bullets, rules) as a wrapped,
+    paginated PDF and return its bytes."""
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.units import inch
+    from reportlab.platypus import SimpleDocTemplate
+
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter, leftMargin=0.75 * inch, rightMargin=0.75 * inch,
+                            topMargin=0.75 * inch, bottomMargin=0.75 * inch)
+    doc.build(_flowables(text))
+    return buffer.getvalue()
+
+
+def create_pdf(text):
+    """Return PDF bytes for text, re-rendering only when the content changes."""
+    key = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    with _lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            _stats["hits"] += 1
+            return _cache[key]
+        _stats["misses"] += 1
+    pdf = render_pdf(text)
+    with _lock:
+        _cache[key] = pdf
+        _cache.move_to_end(key)
+        while len(_cache) > PDF_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return pdf
+
+
+def cache_stats():
+    with _lock:
+        return dict(_stats, size=len(_cache))
@@ -0,0 +1,260 @@
+"""Bulk pre-generation of quiz questions and flashcards.
+
+Fills every topic in the catalog up to a target count:
+
+    python pregenerate.py --quiz 200 --flashcards 100
+
+Requests run concurrently in batches under a requests-per-minute limit.
+Only items that pass validation and the near-duplicate filter are kept.
+They are appended to a gzipped JSON-lines pack (one ``[kind, topic, item]``
+per line, one gzip member per batch). After each batch the byte offset of
+the pack is checkpointed, so a crashed or interrupted run resumes where it
+stopped; rerunning with higher targets tops the pack up. The app loads the
+pack into the question bank and flashcard pool at startup.
+"""
+import argparse
+import asyncio
+import gzip
+import io
+import json
+import logging
+import os
+import random
+import time
+import zlib
+from collections import Counter, deque
+
+from catalog import (
+    FLASHCARD_PARSER, MAX_AVOID, QUIZ_PARSER, RESPONSE_FORMAT, TOPICS,
+    flashcard_messages, quiz_messages, shard_focuses,
+)
+from near_dup import NearDupIndex
+from resilience import is_retryable
+from stream_parse import iter_items
+
+logger = logging.getLogger("dmv_tutor.pregenerate")
+
+PACK_PATH = "pregenerated.jsonl.gz"
+QUIZ_TARGET = 100
+FLASHCARD_TARGET = 50
+# Items asked for per request
+BATCH_SIZE = 10
+CONCURRENCY = 4
+REQUESTS_PER_MINUTE = 60
+REQUEST_TIMEOUT = 120
+MAX_RETRIES = 3
+# Give up on a topic after this many rounds that add nothing new
+MAX_EMPTY_ROUNDS = 3
+
+KINDS = {
+    "quiz": (quiz_messages, QUIZ_PARSER),
+    "flashcards": (flashcard_messages, FLASHCARD_PARSER),
+}
+
+
+# === Pack file ===
+def read_pack(path, limit=None):
+    """Yield (kind, topic, item) from a pack, up to ``limit`` bytes. A
+    truncated final batch (from a crash mid-write) is skipped."""
+    with open(path, "rb") as f:
+        data = f.read() if limit is None else f.read(limit)
+    try:
+        with gzip.GzipFile(fileobj=io.BytesIO(data)) as gz:
+            for line in gz:
+                kind, topic, item = json.loads(line)
+                yield kind, topic, item
+    except (EOFError, gzip.BadGzipFile, zlib.error, ValueError) as e:
+        logger.warning("Ignoring damaged tail of %s: %s", path, e)
+
+
+def append_batch(path, records):
+    """Append records as one gzip member; returns the new file size."""
+    with open(path, "ab") as f:
+        with gzip.GzipFile(fileobj=f, mode="ab") as gz:
+            for record in records:
+                gz.write(json.dumps(record, separators=(",", ":")).encode() + b"\n")
+        f.flush()
+        os.fsync(f.fileno())
+        return f.tell()
+
+
+def load_checkpoint(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def save_checkpoint(path, state):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+
+# === Rate limiting ===
+class RateLimiter:
+    """Spaces request starts evenly at ``per_minute``."""
+
+    def __init__(self, per_minute):
+        self.interval = 60.0 / per_minute if per_minute else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+# === Generation ===
+class Pregenerator:
+    def __init__(self, out, targets, batch_size=BATCH_SIZE, concurrency=CONCURRENCY,
+                 per_minute=REQUESTS_PER_MINUTE, model="gpt-4-turbo"):
+        self.out = out
+        self.checkpoint = out + ".ckpt.json"
+        self.targets = targets              # (kind, topic) -> wanted count
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.per_minute = per_minute
+        self.model = model
+        self.counts = Counter()
+        self.index = NearDupIndex()
+        self.recent = {}                    # (kind, topic) -> recent stems for the prompt
+        self.requests = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def resume(self):
+        """Drop anything past the last checkpoint and re-index what's kept."""
+        state = load_checkpoint(self.checkpoint)
+        if os.path.exists(self.out):
+            # Without a checkpoint, trust the whole pack
+            offset = state["offset"] if state else os.path.getsize(self.out)
+            with open(self.out, "r+b") as f:
+                f.truncate(offset)
+            for kind, topic, item in read_pack(self.out):
+                part = (kind, topic)
+                self.counts[part] += 1
+                self.index.add(part, item)
+                self.recent.setdefault(part, deque(maxlen=MAX_AVOID)).append(item["question"])
+        else:
+            offset = 0
+        save_checkpoint(self.checkpoint, {"offset": offset, "counts": self._count_map()})
+        return offset
+
+    def _count_map(self):
+        return {f"{kind}/{topic}": n for (kind, topic), n in sorted(self.counts.items())}
+
+    def remaining(self, part):
+        return max(0, self.targets[part] - self.counts[part])
+
+    async def _complete(self, client, messages):
+        for attempt in range(MAX_RETRIES + 1):
+            await self._limiter.wait()
+            async with self._sem:
+                self.requests += 1
+                try:
+                    extra = {"response_format": RESPONSE_FORMAT} if RESPONSE_FORMAT else {}
+                    response = await client.chat.completions.create(
+                        model=self.model, messages=messages, timeout=REQUEST_TIMEOUT, **extra
+                    )
+                    return response.choices[0].message.content or ""
+                except Exception as e:
+                    if attempt == MAX_RETRIES or not is_retryable(e):
+                        raise
+                    logger.warning("Request failed (%s), retrying", e)
+            await asyncio.sleep(2 ** attempt * random.uniform(0.5, 1.5))
+
+    def commit(self, part, texts):
+        """Validate, de-duplicate and append one round's output. Returns items added."""
+        kind, topic = part
+        _, make_parser = KINDS[kind]
+        items = []
+        for text in texts:
+            parser = make_parser()
+            items.extend(iter_items(parser, [text]))
+            self.rejected += len(parser.errors)
+        kept = self.index.filter(part, items)[:self.remaining(part)]
+        self.rejected += len(items) - len(kept)
+        if not kept:
+            return 0
+        offset = append_batch(self.out, [[kind, topic, item] for item in kept])
+        self.counts[part] += len(kept)
+        self.recent.setdefault(part, deque(maxlen=MAX_AVOID)).extend(i["question"] for i in kept)
+        save_checkpoint(self.checkpoint, {"offset": offset, "counts": self._count_map()})
+        logger.info("%s/%s: %d/%d", kind, topic, self.counts[part], self.targets[part])
+        return len(kept)
+
+    async def fill(self, client, part):
+        kind, topic = part
+        make_messages, _ = KINDS[kind]
+        empty_rounds = 0
+        while self.remaining(part) and empty_rounds < MAX_EMPTY_ROUNDS:
+            need = self.remaining(part)
+            sizes = [min(self.batch_size, need - i) for i in range(0, need, self.batch_size)]
+            avoid = list(self.recent.get(part, ()))
+            results = await asyncio.gather(*(
+                self._complete(client, make_messages(topic, n, focus, avoid))
+                for n, focus in zip(sizes, shard_focuses(topic, len(sizes)))
+            ), return_exceptions=True)
+            errors = [r for r in results if isinstance(r, BaseException)]
+            for e in errors:
+                logger.warning("%s/%s: request failed: %s", kind, topic, e)
+            self.failed += len(errors)
+            added = self.commit(part, [r for r in results if isinstance(r, str)])
+            empty_rounds = 0 if added else empty_rounds + 1
+        if self.remaining(part):
+            logger.warning("%s/%s: stopped at %d/%d (no new items)", kind, topic,
+                           self.counts[part], self.targets[part])
+
+    async def run(self, client):
+        self._sem = asyncio.Semaphore(self.concurrency)
+        self._limiter = RateLimiter(self.per_minute)
+        await asyncio.gather(*(self.fill(client, part) for part in self.targets if self.remaining(part)))
+
+    def summary(self):
+        return {
+            "counts": self._count_map(),
+            "requests": self.requests,
+            "failed_requests": self.failed,
+            "rejected_items": self.rejected,
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pre-generate quiz questions and flashcards for every topic")
+    parser.add_argument("--quiz", type=int, default=QUIZ_TARGET, help="quiz questions per topic")
+    parser.add_argument("--flashcards", type=int, default=FLASHCARD_TARGET, help="flashcards per topic")
+    parser.add_argument("--topics", nargs="+", choices=TOPICS, default=list(TOPICS))
+    parser.add_argument("--out", default=os.environ.get("PREGENERATED_PATH", PACK_PATH))
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    parser.add_argument("--rpm", type=int, default=REQUESTS_PER_MINUTE, help="requests per minute")
+    parser.add_argument("--model", default="gpt-4-turbo")
+    parser.add_argument("--fresh", action="store_true", help="discard any existing pack and checkpoint")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    targets = {("quiz", t): args.quiz for t in args.topics} | {("flashcards", t): args.flashcards for t in args.topics}
+    gen = Pregenerator(args.out, targets, args.batch_size, args.concurrency, args.rpm, args.model)
+    if args.fresh:
+        for path in (args.out, gen.checkpoint):
+            if os.path.exists(path):
+                os.remove(path)
+    gen.resume()
+
+    from resources import get_async_openai, run_async
+    start = time.perf_counter()
+    run_async(gen.run(get_async_openai())).result()
+    summary = gen.summary() | {"seconds": round(time.perf_counter() - start, 2)}
+    print(json.dumps(summary, indent=2))
+    return summary
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+import json
+import random
+import sqlite3
+import threading
+
+# Refill a topic in the background once it drops below this many questions
+LOW_WATER_MARK = 30
+# Questions requested per background generation call
+REFILL_BATCH = 10
+# Give up on a refill after this many calls that add nothing new
+MAX_EMPTY_REFILLS = 3
+
+
+def validate_question(q):
+    """Return True if a parsed quiz question is complete and answerable."""
+    if not isinstance(q, dict) or not str(q.get("question", "")).strip():
+        return False
+    options = q.get("options") or {}
+    if sorted(options) != ["A", "B", "C", "D"]:
+        return False
+    if any(not str(v).strip() for v in options.values()):
+        return False
+    return q.get("answer") in options
+
+
+class QuestionBank:
+    """Pre-generated quiz questions stored in SQLite, keyed by topic.
+
+    Safe to share across Streamlit sessions: all access goes through one
+    connection guarded by a lock.
+    """
+
+    def __init__(self, path="question_bank.db", low_water=LOW_WATER_MARK):
+        self.low_water = low_water
+        self._lock = threading.Lock()
+        self._refilling = set()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS questions ("
+                " id INTEGER PRIMARY KEY,"
+                " topic TEXT NOT NULL,"
+                " stem TEXT NOT NULL,"
+                " payload TEXT NOT NULL,"
+                " UNIQUE (topic, stem))"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS questions_topic ON questions (topic)"
+            )
+
+    def add(self, topic, questions):
+        """Store the valid questions for a topic. Returns how many were new."""
+        rows = [
+            (topic, q["question"].strip().lower(), json.dumps(q))
+            for q in questions if validate_question(q)
+        ]
+        with self._lock, self._conn:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO questions (topic, stem, payload) VALUES (?, ?, ?)",
+                rows,
+            )
+            return self._conn.total_changes - before
+
+    def count(self, topic):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(*) FROM questions WHERE topic = ?", (topic,)
+            ).fetchone()
+        return row[0]
+
+    def iter_questions(self):
+        """Every stored (topic, question)."""
+        with self._lock:
+            rows = self._conn.execute("SELECT topic, payload FROM questions").fetchall()
+        for topic, payload in rows:
+            yield topic, json.loads(payload)
+
+    def draw(self, topic, n):
+        """Return up to n random questions for a topic (empty if none stored)."""
+        with self._lock:
+            ids = [r[0] for r in self._conn.execute(
+                "SELECT id FROM questions WHERE topic = ?", (topic,)
+            )]
+            if not ids:
+                return []
+            picked = random.sample(ids, min(n, len(ids)))
+            marks = ",".join("?" * len(picked))
+            rows = self._conn.execute(
+                f"SELECT payload FROM questions WHERE id IN ({marks})", picked
+            ).fetchall()
+        quiz = [json.loads(r[0]) for r in rows]
+        random.shuffle(quiz)
+        return quiz
+
+    def needs_refill(self, topic):
+        return self.count(topic) < self.low_water
+
+    def refill_async(self, topic, generate):
+        """Top a topic up to the low-water mark on a background thread.
+
+        ``generate`` is called with no arguments and must return a list of
+        parsed questions. Returns False if no refill was started (topic is
+        already full or a refill for it is in flight).
+        """
+        if not self.needs_refill(topic):
+            return False
+        with self._lock:
+            if topic in self._refilling:
+                return False
+            self._refilling.add(topic)
+        threading.Thread(
+            target=self._refill, args=(topic, generate), daemon=True
+        ).start()
+        return True
+
+    def _refill(self, topic, generate):
+        empty = 0
+        try:
+            while self.needs_refill(topic) and empty < MAX_EMPTY_REFILLS:
+                try:
+                    added = self.add(topic, generate())
+                except Exception:
+                    added = 0
+                empty = 0 if added else empty + 1
+        finally:
+            with self._lock:
+                self._refilling.discard(topic)
@@ -0,0 +1,287 @@
+"""Deadlines, retries, hedging and circuit breaking for OpenAI calls.
+
+``Resilience.call(fn)`` runs ``fn(model, timeout)`` with:
+
+- a per-attempt timeout and an overall deadline,
+- jittered exponential backoff between retries of transient errors,
+- a hedged second request when the first is slower than that model's
+  recent p95 (whichever answers first wins),
+- a per-model circuit breaker; while the primary model's breaker is open,
+  calls go to the fallback model, and CircuitOpen is raised if both are open.
+
+Latency is tracked per model so tail percentiles can be exported.
+"""
+import contextvars
+import random
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import telemetry
+
+DEADLINE = 60.0
+ATTEMPT_TIMEOUT = 30.0
+RETRIES = 2
+BASE_BACKOFF = 0.5
+# Hedge after the model's p95, but never sooner than this
+MIN_HEDGE_DELAY = 1.0
+# Latency samples needed before hedging kicks in
+MIN_HEDGE_SAMPLES = 20
+LATENCY_WINDOW = 200
+
+BREAKER_WINDOW = 20
+BREAKER_MIN_CALLS = 5
+BREAKER_ERROR_RATE = 0.5
+BREAKER_COOLDOWN = 30.0
+
+# HTTP statuses that retrying won't fix
+_NOT_RETRYABLE = {400, 401, 403, 404, 422}
+
+
+class CircuitOpen(Exception):
+    pass
+
+
+def is_retryable(exc):
+    return getattr(exc, "status_code", None) not in _NOT_RETRYABLE
+
+
+class LatencyTracker:
+    def __init__(self, window=LATENCY_WINDOW):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def percentile(self, pct):
+        with self._lock:
+            ordered = sorted(self._samples)
+        if not ordered:
+            return None
+        return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+
+
+class CircuitBreaker:
+    """Opens when the recent error rate spikes; after a cooldown it lets
+    one trial call through (half-open) and closes again if that succeeds.
+
+    ``allow()`` returns a token: True for an ordinary call, a trial token
+    for the half-open trial, or None when the call is refused. Pass it back
+    to ``record``/``release``. While the breaker isn't closed only the
+    trial's result counts; results from calls that started earlier (or
+    from outside ``allow()``) are ignored, so they can't flap it.
+    """
+
+    def __init__(self, window=BREAKER_WINDOW, min_calls=BREAKER_MIN_CALLS,
+                 error_rate=BREAKER_ERROR_RATE, cooldown=BREAKER_COOLDOWN):
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.cooldown = cooldown
+        self.opened_at = None
+        self._results = deque(maxlen=window)
+        self._trial = None
+        self._trial_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            # A trial that never reported back (lost thread) expires with its deadline
+            stale = time.monotonic() - self._trial_at >= DEADLINE
+            if state == "half-open" and (self._trial is None or stale):
+                self._trial = object()
+                self._trial_at = time.monotonic()
+                return self._trial
+            return None
+
+    def release(self, token=None):
+        """End a call that says nothing about the model's health (a rejected
+        request), so the half-open trial slot isn't held."""
+        with self._lock:
+            if token is not None and token is self._trial:
+                self._trial = None
+
+    def record(self, ok, token=None):
+        with self._lock:
+            if self.opened_at is not None:
+                if token is None or token is not self._trial:
+                    return      # not the trial: a stale or outside result
+                self._trial = None
+                if ok:
+                    self.opened_at = None
+                    self._results.clear()
+                else:
+                    self.opened_at = time.monotonic()
+                return
+            self._results.append(ok)
+            failures = self._results.count(False)
+            if len(self._results) >= self.min_calls and failures / len(self._results) >= self.error_rate:
+                self.opened_at = time.monotonic()
+
+
+class Resilience:
+    def __init__(self, primary, fallback=None, deadline=DEADLINE, attempt_timeout=ATTEMPT_TIMEOUT,
+                 retries=RETRIES, acquire_hedge=lambda: True,
+                 release_hedge=lambda: None):
+        self.models = [m for m in (primary, fallback) if m]
+        self.deadline = deadline
+        self.attempt_timeout = attempt_timeout
+        self.retries = retries
+        # A hedge needs its own concurrency slot: acquire_hedge() takes one
+        # without blocking (False = skip the hedge), release_hedge() frees it
+        self.acquire_hedge = acquire_hedge
+        self.release_hedge = release_hedge
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.fallbacks = 0
+        self.breakers = {m: CircuitBreaker() for m in self.models}
+        self.latency = {}
+        self._pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="llm-hedge")
+        self._lock = threading.Lock()
+
+    def _tracker(self, model, kind):
+        with self._lock:
+            return self.latency.setdefault((model, kind), LatencyTracker())
+
+    def choose_model(self):
+        """(model, breaker token) for the first model whose breaker lets a
+        call through, or (None, None)."""
+        for i, model in enumerate(self.models):
+            token = self.breakers[model].allow()
+            if token:
+                if i:
+                    self.fallbacks += 1
+                return model, token
+        return None, None
+
+    def preferred_model(self):
+        """Model to use for calls made outside ``call()`` (e.g. fan-out shards):
+        the first closed one. Half-open models are probed by ``call()``'s
+        single trial, not by a burst of shards."""
+        for model in self.models:
+            if self.breakers[model].state == "closed":
+                return model
+        return None
+
+    def record_failure(self, model):
+        """Count a failure that happened after ``call()`` returned (mid-stream)."""
+        self.breakers[model].record(False)
+
+    def record_result(self, model, error=None):
+        """Count a call made outside ``call()`` (e.g. a fan-out shard) toward
+        the model's breaker. Rejected requests say nothing about its health;
+        once the breaker has opened, only ``call()``'s trial can close it."""
+        if error is None:
+            self.breakers[model].record(True)
+        elif is_retryable(error):
+            self.breakers[model].record(False)
+
+    def hedge_delay(self, model, kind):
+        tracker = self._tracker(model, kind)
+        if len(tracker) < MIN_HEDGE_SAMPLES:
+            return None
+        return max(MIN_HEDGE_DELAY, tracker.percentile(95))
+
+    def _attempt(self, fn, model, timeout, kind, token=True):
+        start = time.perf_counter()
+        try:
+            result = fn(model, timeout)
+        except Exception as e:
+            elapsed = time.perf_counter() - start
+            if is_retryable(e):
+                self.breakers[model].record(False, token)
+            else:
+                self.breakers[model].release(token)
+            telemetry.observe("dmv_llm_attempt_seconds", elapsed, model=model, kind=kind, outcome="error")
+            raise
+        elapsed = time.perf_counter() - start
+        self.breakers[model].record(True, token)
+        self._tracker(model, kind).add(elapsed)
+        telemetry.observe("dmv_llm_attempt_seconds", elapsed, model=model, kind=kind, outcome="ok")
+        return result
+
+    def _submit(self, *args):
+        return self._pool.submit(contextvars.copy_context().run, self._attempt, *args)
+
+    def _hedged(self, fn, model, timeout, kind, token=True):
+        # Both requests carry the token; whichever reports first settles a trial
+        futures = [self._submit(fn, model, timeout, kind, token)]
+        delay = self.hedge_delay(model, kind)
+        if delay is not None and delay < timeout:
+            done, _ = wait(futures, timeout=delay)
+            if not done and self.acquire_hedge():
+                self.hedges += 1
+                hedge = self._submit(fn, model, timeout, kind, token)
+                hedge.add_done_callback(lambda _: self.release_hedge())
+                futures.append(hedge)
+        pending = set(futures)
+        error = None
+        while pending:
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                raise TimeoutError(f"{model} did not answer within {timeout:.0f}s")
+            for future in done:
+                if future.exception() is None:
+                    if future is not futures[0]:
+                        self.hedge_wins += 1
+                    # The losing request finishes in the background and is ignored
+                    return future.result()
+                error = error or future.exception()
+        raise error
+
+    def call(self, fn, hedge=True, kind="completion"):
+        """Run ``fn(model, timeout)`` under the policy above and return its result."""
+        deadline = time.monotonic() + self.deadline
+        error = None
+        for attempt in range(self.retries + 1):
+            # Check the deadline before choose_model(), which may claim a half-open trial
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            model, token = self.choose_model()
+            if model is None:
+                raise CircuitOpen("OpenAI is failing right now; every model's circuit is open")
+            timeout = min(self.attempt_timeout, remaining)
+            try:
+                if hedge:
+                    return self._hedged(fn, model, timeout, kind, token)
+                return self._attempt(fn, model, timeout, kind, token)
+            except Exception as e:
+                error = e
+                if not is_retryable(e):
+                    raise
+            if attempt < self.retries:
+                backoff = BASE_BACKOFF * (2 ** attempt) * random.uniform(0.5, 1.5)
+                time.sleep(max(0.0, min(backoff, deadline - time.monotonic())))
+        raise error or TimeoutError("OpenAI call deadline exceeded")
+
+    def stats(self):
+        stats = {"hedges": self.hedges, "hedge_wins": self.hedge_wins, "fallbacks": self.fallbacks}
+        with self._lock:
+            trackers = dict(self.latency)
+        for (model, kind), tracker in trackers.items():
+            name = re.sub(r"[^a-zA-Z0-9]", "_", f"{model}_{kind}")
+            for pct in (50, 95, 99):
+                value = tracker.percentile(pct)
+                if value is not None:
+                    stats[f"{name}_p{pct}_seconds"] = value
+        for model, breaker in self.breakers.items():
+            stats[re.sub(r"[^a-zA-Z0-9]", "_", model) + "_breaker_open"] = int(breaker.state != "closed")
+        return stats
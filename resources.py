@@ -0,0 +1,116 @@
+"""Process-wide clients and configuration.
+
+Streamlit re-runs app.py top to bottom on every interaction. Everything in
+this module is built once per process and then shared by every rerun and
+session, so HTTP keep-alive connections survive between clicks. Heavy SDKs
+are imported on first use.
+"""
+import asyncio
+import functools
+import os
+import threading
+
+import httpx
+import streamlit as st
+
+OPENAI_PROJECT = "proj_36JJwFCLQG34Xyiqb0EWUJlN"
+# Connection pool shared by all sessions talking to one upstream
+POOL_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=60)
+SUPABASE_TIMEOUT = 30
+
+
+# ── Load configuration from env vars or st.secrets ─────────────────────
+@functools.cache
+def env_or_secret(env: str, section: str | None, key: str):
+    if env in os.environ:
+        return os.environ[env]
+    if section:
+        if section in st.secrets and key in st.secrets[section]:
+            return st.secrets[section][key]
+    elif key in st.secrets:
+        return st.secrets[key]
+    raise RuntimeError(f"Missing configuration for {env}")
+
+
+# === OpenAI ===
+@functools.cache
+def get_openai():
+    from openai import DefaultHttpxClient, OpenAI
+    return OpenAI(
+        api_key=env_or_secret("OPENAI_API_KEY", None, "openai_api_key"),
+        project=OPENAI_PROJECT,
+        http_client=DefaultHttpxClient(limits=POOL_LIMITS),
+    )
+
+
+@functools.cache
+def get_async_openai():
+    """Async client; only ever used on the background loop from get_event_loop()."""
+    from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+    return AsyncOpenAI(
+        api_key=env_or_secret("OPENAI_API_KEY", None, "openai_api_key"),
+        project=OPENAI_PROJECT,
+        http_client=DefaultAsyncHttpxClient(limits=POOL_LIMITS),
+    )
+
+
+# === Background event loop for async fan-out ===
+@functools.cache
+def get_event_loop():
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="async-loop", daemon=True).start()
+    return loop
+
+
+def run_async(coro):
+    """Schedule a coroutine on the shared loop; returns a concurrent Future."""
+    return asyncio.run_coroutine_threadsafe(coro, get_event_loop())
+
+
+# === Supabase ===
+def _create_supabase(key: str, pooled: bool = True):
+    from supabase import ClientOptions, create_client
+    options = ClientOptions(
+        auto_refresh_token=False,
+        persist_session=False,
+        httpx_client=httpx.Client(limits=POOL_LIMITS, timeout=SUPABASE_TIMEOUT) if pooled else None,
+    )
+    url = env_or_secret("SUPABASE_URL", "supabase", "url")
+    return create_client(url, key, options=options)
+
+
+@functools.cache
+def get_supabase():
+    """Shared anon-key client. Never sign in on it: auth state is per client."""
+    return _create_supabase(env_or_secret("SUPABASE_ANON_KEY", "supabase", "anon_key"))
+
+
+@functools.cache
+def get_supabase_srv():
+    """Shared service-role client for bypassing RLS (access unlock, batch writes)."""
+    return _create_supabase(env_or_secret("SUPABASE_SERVICE_ROLE_KEY", "supabase", "service_key"))
+
+
+def new_auth_client():
+    """Fresh anon client for sign-in/sign-up, so one user's session never
+    leaks into the shared client."""
+    return _create_supabase(env_or_secret("SUPABASE_ANON_KEY", "supabase", "anon_key"), pooled=False)
+
+
+# === Stripe ===
+@functools.cache
+def get_stripe():
+    import stripe
+    stripe.api_key = env_or_secret("STRIPE_SECRET_KEY", "stripe", "secret_key")
+    if "STRIPE_API_BASE" in os.environ:   # e.g. a local stub (see bench/)
+        stripe.api_base = os.environ["STRIPE_API_BASE"]
+    return stripe
+
+
+@functools.cache
+def stripe_settings():
+    return {
+        "price_id": env_or_secret("STRIPE_PRICE_ID", "stripe", "price_id"),
+        "success_url": env_or_secret("STRIPE_SUCCESS_URL", "stripe", "success_url"),
+        "cancel_url": env_or_secret("STRIPE_CANCEL_URL", "stripe", "cancel_url"),
+    }
@@ -0,0 +1,127 @@
+import atexit
+import logging
+import queue
+import random
+import threading
+import time
+
+logger = logging.getLogger("dmv_tutor.score_writer")
+
+# Flush when this many rows are waiting...
+MAX_BATCH = 50
+# ...or when the oldest waiting row is this many seconds old
+MAX_DELAY = 2.0
+MAX_RETRIES = 5
+BASE_BACKOFF = 0.5
+
+
+class ScoreWriter:
+    """Write-behind queue that batches quiz score rows into bulk inserts.
+
+    ``insert_batch`` is called from a background thread with a list of rows
+    and should raise on failure. Failed batches are retried with jittered
+    exponential backoff, so it must be idempotent: a batch that failed only
+    in transit may already be stored. Pending rows are flushed on
+    interpreter exit.
+    """
+
+    def __init__(self, insert_batch, max_batch=MAX_BATCH, max_delay=MAX_DELAY,
+                 max_retries=MAX_RETRIES, base_backoff=BASE_BACKOFF):
+        self.insert_batch = insert_batch
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self._queue = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="score-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def enqueue(self, row):
+        if self._closed:
+            raise RuntimeError("ScoreWriter is closed")
+        self.enqueued += 1
+        self._queue.put(row)
+
+    def flush(self):
+        """Block until every row enqueued so far has been written or dropped."""
+        self._queue.join()
+
+    def close(self, timeout=10):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            row = self._queue.get()
+            if row is None:
+                self._queue.task_done()
+                return
+            batch = [row]
+            deadline = time.monotonic() + self.max_delay
+            stop = False
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    row = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if row is None:
+                    stop = True
+                    break
+                batch.append(row)
+            self._write(batch)
+            for _ in range(len(batch) + stop):
+                self._queue.task_done()
+            if stop:
+                self._drain()
+                return
+
+    def _drain(self):
+        # Shutting down: write whatever is left without waiting for max_delay
+        items = []
+        while True:
+            try:
+                items.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        batch = [r for r in items if r is not None]
+        for i in range(0, len(batch), self.max_batch):
+            self._write(batch[i:i + self.max_batch])
+        for _ in items:
+            self._queue.task_done()
+
+    def _write(self, batch):
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.insert_batch(batch)
+                self.written += len(batch)
+                self.batches += 1
+                return
+            except Exception as e:
+                if attempt == self.max_retries:
+                    self.dropped += len(batch)
+                    logger.error("Dropping %d quiz scores after %d attempts: %s",
+                                 len(batch), attempt + 1, e)
+                    return
+                delay = self.base_backoff * (2 ** attempt)
+                time.sleep(delay * random.uniform(0.5, 1.5))
+
+    def stats(self):
+        return {
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "dropped": self.dropped,
+            "batches": self.batches,
+            "pending": self._queue.qsize(),
+        }
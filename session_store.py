@@ -0,0 +1,244 @@
+"""Compact, bounded per-session state.
+
+Each signed-in browser's chat, quiz and flashcard state is kept in a
+slotted SessionRecord instead of loose dicts in ``st.session_state``.
+Records hold no credentials; the app keys them by user id and a random
+browser key, and only looks them up after login. Records are
+capped in size (the oldest chat turns go first, already-summarized ones
+before the rest). The store holds at most ``max_sessions`` of them and
+evicts any idle longer than ``idle_ttl``.
+
+With a backend (SQLite here; anything with the same get/put/purge methods,
+e.g. a Redis wrapper, would do) every save is written through and every
+lookup reads the stored copy, so several app processes can serve the same
+session and sessions survive a restart.
+"""
+import json
+import secrets
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+MAX_SESSIONS = 1000
+IDLE_TTL = 3600
+# Persisted sessions untouched this long are deleted
+PERSIST_TTL = 7 * 86400
+PURGE_INTERVAL = 600
+MAX_CHAT_MESSAGES = 100
+MAX_SESSION_BYTES = 64 * 1024
+
+
+def new_session_key():
+    return secrets.token_urlsafe(16)
+
+
+class QuizItem:
+    __slots__ = ("question", "options", "answer")
+
+    def __init__(self, question, options, answer):
+        self.question = question
+        self.options = tuple(options)     # texts for A-D, in order
+        self.answer = answer
+
+    @classmethod
+    def from_dict(cls, q):
+        return cls(q["question"], (q["options"][k] for k in sorted(q["options"])), q["answer"])
+
+    def lettered(self):
+        return list(zip("ABCD", self.options))
+
+
+class Card:
+    __slots__ = ("card_id", "topic", "question", "answer")
+
+    def __init__(self, card_id, topic, question, answer):
+        self.card_id = card_id
+        self.topic = topic
+        self.question = question
+        self.answer = answer
+
+    @classmethod
+    def from_dict(cls, c):
+        return cls(c["card_id"], c["topic"], c["question"], c["answer"])
+
+
+class SessionRecord:
+    __slots__ = (
+        "key", "chat", "chat_summary", "chat_folded",
+        "quiz", "quiz_answers", "quiz_submitted",
+        "flashcards", "revealed", "graded", "progress_page", "touched",
+    )
+
+    def __init__(self, key):
+        self.key = key
+        self.chat = []                # [(role, content)], system prompt not stored
+        self.chat_summary = ""        # ChatContext state for the turns above
+        self.chat_folded = 0
+        self.quiz = None              # [QuizItem]
+        self.quiz_answers = []        # letter or None per question
+        self.quiz_submitted = False
+        self.flashcards = None        # [Card]
+        self.revealed = []            # bool per card
+        self.graded = []              # next-review label or None per card
+        self.progress_page = 0
+        self.touched = time.time()
+
+    # --- chat ---
+    def history(self, system_prompt):
+        """Chat as the message list ChatContext expects."""
+        return [{"role": "system", "content": system_prompt}] + [
+            {"role": role, "content": content} for role, content in self.chat
+        ]
+
+    def add_message(self, role, content):
+        self.chat.append((role, content))
+
+    def clear_chat(self):
+        self.chat = []
+        self.chat_summary = ""
+        self.chat_folded = 0
+
+    # --- quiz and flashcards ---
+    def start_quiz(self, questions):
+        self.quiz = [QuizItem.from_dict(q) for q in questions]
+        self.quiz_answers = [None] * len(self.quiz)
+        self.quiz_submitted = False
+
+    def start_flashcards(self, cards):
+        self.flashcards = [Card.from_dict(c) for c in cards]
+        self.revealed = [False] * len(self.flashcards)
+        self.graded = [None] * len(self.flashcards)
+
+    # --- size and serialization ---
+    def _fields(self):
+        return [
+            self.chat, self.chat_summary, self.chat_folded,
+            [[q.question, q.options, q.answer] for q in self.quiz] if self.quiz is not None else None,
+            self.quiz_answers, self.quiz_submitted,
+            [[c.card_id, c.topic, c.question, c.answer] for c in self.flashcards]
+            if self.flashcards is not None else None,
+            self.revealed, self.graded, self.progress_page, self.touched,
+        ]
+
+    def encode(self):
+        return json.dumps(self._fields(), separators=(",", ":")).encode()
+
+    def trim(self):
+        """Drop the oldest chat turns until the record is within its caps.
+        The oldest turns are the ones already folded into the summary."""
+        self._drop_chat(len(self.chat) - MAX_CHAT_MESSAGES)
+        while len(self.chat) > 1 and len(self.encode()) > MAX_SESSION_BYTES:
+            self._drop_chat(max(1, len(self.chat) // 4))
+
+    def _drop_chat(self, n):
+        if n > 0:
+            del self.chat[:n]
+            self.chat_folded = max(0, self.chat_folded - n)
+
+    def dump(self):
+        return zlib.compress(self.encode())
+
+    @classmethod
+    def load(cls, key, blob):
+        (chat, summary, folded, quiz, answers, submitted,
+         cards, revealed, graded, page, touched) = json.loads(zlib.decompress(blob))
+        rec = cls(key)
+        rec.chat = [tuple(m) for m in chat]
+        rec.chat_summary, rec.chat_folded = summary, folded
+        rec.quiz = [QuizItem(*q) for q in quiz] if quiz is not None else None
+        rec.quiz_answers, rec.quiz_submitted = answers, submitted
+        rec.flashcards = [Card(*c) for c in cards] if cards is not None else None
+        rec.revealed, rec.graded, rec.progress_page, rec.touched = revealed, graded, page, touched
+        return rec
+
+
+class SQLiteSessionBackend:
+    """Session records in a SQLite file that several processes on one host can share."""
+
+    def __init__(self, path="sessions.db"):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                " key TEXT PRIMARY KEY,"
+                " data BLOB NOT NULL,"
+                " touched REAL NOT NULL)"
+            )
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM sessions WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def put(self, key, data, touched):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions (key, data, touched) VALUES (?, ?, ?)",
+                (key, data, touched),
+            )
+
+    def purge(self, older_than):
+        with self._lock, self._conn:
+            return self._conn.execute("DELETE FROM sessions WHERE touched < ?", (older_than,)).rowcount
+
+
+class SessionStore:
+    def __init__(self, backend=None, max_sessions=MAX_SESSIONS, idle_ttl=IDLE_TTL):
+        self.backend = backend
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.evicted = 0
+        self.saves = 0
+        self._sessions = OrderedDict()
+        self._last_purge = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """The session's record, created empty if it doesn't exist yet."""
+        now = time.time()
+        record = None
+        if self.backend is not None:
+            # The stored copy wins: another process may have updated it
+            blob = self.backend.get(key)
+            if blob is not None:
+                record = SessionRecord.load(key, blob)
+            if now - self._last_purge > PURGE_INTERVAL:
+                self._last_purge = now
+                self.backend.purge(now - PERSIST_TTL)
+        with self._lock:
+            self._evict(now)
+            record = record or self._sessions.get(key) or SessionRecord(key)
+            record.touched = now
+            self._sessions[key] = record
+            self._sessions.move_to_end(key)
+            self._evict(now)
+        return record
+
+    def save(self, record):
+        """Apply the size caps and write the record through to the backend."""
+        record.trim()
+        record.touched = time.time()
+        self.saves += 1
+        if self.backend is not None:
+            self.backend.put(record.key, record.dump(), record.touched)
+
+    def _evict(self, now):
+        # Caller holds the lock; oldest-touched sessions are at the front
+        while self._sessions:
+            key, record = next(iter(self._sessions.items()))
+            if len(self._sessions) <= self.max_sessions and now - record.touched < self.idle_ttl:
+                break
+            del self._sessions[key]
+            self.evicted += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "evicted": self.evicted,
+                "saves": self.saves,
+            }
@@ -0,0 +1,72 @@
+"""Coalesce identical in-flight LLM generations.
+
+When several sessions ask for the same thing at the same moment (same page,
+topic, size and prompt), only the first caller runs the generation; the
+others wait for it and share its result.
+"""
+import hashlib
+import json
+import threading
+
+
+def flight_key(page, topic, n, messages):
+    digest = hashlib.sha256(json.dumps(messages, sort_keys=True).encode()).hexdigest()[:16]
+    return (page, topic, n, digest)
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self):
+        self.leaders = 0
+        self.coalesced = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        """Run ``fn()`` once per key at a time. Returns ``(result, shared)``;
+        ``shared`` is True when the result came from another caller's run.
+        Errors from the leader are raised in every waiting caller."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+            else:
+                call.waiters += 1
+                self.coalesced += 1
+        if leader:
+            try:
+                call.result = fn()
+            except Exception as e:
+                call.error = e
+            except BaseException:
+                # Leader's script was stopped (e.g. the user navigated away)
+                call.error = RuntimeError("The shared generation was interrupted, please try again")
+                raise
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+        else:
+            call.done.wait()
+        if call.error is not None:
+            raise call.error
+        return call.result, not leader
+
+    def stats(self):
+        with self._lock:
+            return {
+                "leaders": self.leaders,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._calls),
+            }
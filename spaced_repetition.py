@@ -0,0 +1,232 @@
+"""Per-user spaced repetition (SM-2) for flashcards.
+
+Cards live in a shared SQLite pool keyed by topic. Each user has a review
+row per card holding its SM-2 state and next due time. An in-memory heap
+per user and topic, loaded lazily from the database, yields the next due
+cards in O(log n) each without touching the LLM. New cards come from the
+pool first; only when that runs dry does the app generate more.
+"""
+import heapq
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+DAY = 86400
+# A failed card comes back this many seconds later, within the same session
+RELEARN_DELAY = 600
+INITIAL_EASE = 2.5
+MIN_EASE = 1.3
+# Users whose due queues are kept in memory
+MAX_CACHED_USERS = 1000
+
+# Grade buttons shown after a card is revealed (SM-2 quality 0-5)
+GRADES = {"Again": 1, "Hard": 3, "Good": 4, "Easy": 5}
+
+
+def sm2(ease, interval, reps, grade):
+    """Next (ease, interval_days, reps) after a review graded 0-5."""
+    if grade < 3:
+        reps, interval = 0, 0
+    else:
+        reps += 1
+        if reps == 1:
+            interval = 1
+        elif reps == 2:
+            interval = 6
+        else:
+            interval = round(interval * ease)
+    ease = max(MIN_EASE, ease + 0.1 - (5 - grade) * (0.08 + (5 - grade) * 0.02))
+    return ease, interval, reps
+
+
+def topic_weights(topics, rollups):
+    """Weight each topic by the user's miss rate in quiz_topic_rollups rows,
+    smoothed so topics with few or no attempts still get picked."""
+    stats = {r["topic"]: r for r in rollups}
+    weights = {}
+    for topic in topics:
+        r = stats.get(topic) or {"correct": 0, "attempted": 0}
+        weights[topic] = (r["attempted"] - r["correct"] + 1) / (r["attempted"] + 2)
+    return weights
+
+
+def pick_topics(weights, n):
+    """n topics drawn with replacement, weak spots more often."""
+    topics = list(weights)
+    return random.choices(topics, weights=[weights[t] for t in topics], k=n) if topics else []
+
+
+def _card_key(question):
+    return " ".join(question.lower().split())
+
+
+class _DueQueue:
+    """One user's due times: a heap per topic plus the current due time of
+    each card, so superseded heap entries can be skipped lazily."""
+
+    def __init__(self, rows):
+        self.heaps = {}
+        self.due = {}
+        for card_id, topic, due in rows:
+            self.push(card_id, topic, due)
+        for heap in self.heaps.values():
+            heapq.heapify(heap)
+
+    def push(self, card_id, topic, due):
+        self.due[card_id] = due
+        heapq.heappush(self.heaps.setdefault(topic, []), (due, card_id))
+
+    def pop_due(self, n, topics, now):
+        """Up to n (due, card_id, topic) entries due by ``now``, earliest first.
+        The entries are removed; push them back if they stay due."""
+        topics = [t for t in (topics or self.heaps) if self.heaps.get(t)]
+        out = []
+        while len(out) < n:
+            best = None
+            for topic in topics:
+                heap = self.heaps[topic]
+                # Drop entries whose card has been rescheduled since
+                while heap and self.due.get(heap[0][1]) != heap[0][0]:
+                    heapq.heappop(heap)
+                if heap and heap[0][0] <= now and (best is None or heap[0] < self.heaps[best][0]):
+                    best = topic
+            if best is None:
+                break
+            due, card_id = heapq.heappop(self.heaps[best])
+            out.append((due, card_id, best))
+        return out
+
+
+class CardStore:
+    """Flashcard pool and per-user SM-2 review state in SQLite.
+
+    Safe to share across Streamlit sessions: all access goes through one
+    connection guarded by a lock.
+    """
+
+    def __init__(self, path="flashcards.db"):
+        self._lock = threading.Lock()
+        self._queues = OrderedDict()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cards ("
+                " id INTEGER PRIMARY KEY,"
+                " topic TEXT NOT NULL,"
+                " key TEXT NOT NULL,"
+                " question TEXT NOT NULL,"
+                " answer TEXT NOT NULL,"
+                " UNIQUE (topic, key))"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS reviews ("
+                " user_id TEXT NOT NULL,"
+                " card_id INTEGER NOT NULL REFERENCES cards (id),"
+                " ease REAL NOT NULL,"
+                " interval REAL NOT NULL,"
+                " reps INTEGER NOT NULL,"
+                " due REAL NOT NULL,"
+                " PRIMARY KEY (user_id, card_id))"
+            )
+
+    def _queue(self, user_id):
+        # Caller holds the lock
+        queue = self._queues.get(user_id)
+        if queue is None:
+            queue = self._queues[user_id] = _DueQueue(self._conn.execute(
+                "SELECT r.card_id, c.topic, r.due FROM reviews r JOIN cards c ON c.id = r.card_id"
+                " WHERE r.user_id = ?", (user_id,)
+            ))
+            if len(self._queues) > MAX_CACHED_USERS:
+                self._queues.popitem(last=False)
+        else:
+            self._queues.move_to_end(user_id)
+        return queue
+
+    def _cards(self, card_ids):
+        marks = ",".join("?" * len(card_ids))
+        rows = self._conn.execute(
+            f"SELECT id, topic, question, answer FROM cards WHERE id IN ({marks})", card_ids
+        ).fetchall()
+        by_id = {r[0]: {"card_id": r[0], "topic": r[1], "question": r[2], "answer": r[3]} for r in rows}
+        return [by_id[i] for i in card_ids if i in by_id]
+
+    def due(self, user_id, n, topics=None, now=None):
+        """Up to n of the user's cards that are due, earliest first."""
+        now = time.time() if now is None else now
+        with self._lock:
+            queue = self._queue(user_id)
+            entries = queue.pop_due(n, topics, now)
+            # Still due until graded
+            for due, card_id, topic in entries:
+                queue.push(card_id, topic, due)
+            return self._cards([card_id for _, card_id, _ in entries]) if entries else []
+
+    def add_cards(self, topic, cards):
+        """Add generated cards to the shared pool. Returns how many were new."""
+        rows = [
+            (topic, _card_key(c["question"]), c["question"].strip(), c["answer"].strip())
+            for c in cards if c.get("question", "").strip() and c.get("answer", "").strip()
+        ]
+        with self._lock, self._conn:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO cards (topic, key, question, answer) VALUES (?, ?, ?, ?)", rows
+            )
+            return self._conn.total_changes - before
+
+    def iter_cards(self):
+        """Every pooled (topic, card)."""
+        with self._lock:
+            rows = self._conn.execute("SELECT topic, question, answer FROM cards").fetchall()
+        for topic, question, answer in rows:
+            yield topic, {"question": question, "answer": answer}
+
+    def assign_new(self, user_id, topic, n, now=None):
+        """Give the user up to n pool cards for a topic they haven't seen yet.
+        They are due immediately. Returns the assigned cards."""
+        now = time.time() if now is None else now
+        with self._lock, self._conn:
+            # Load the queue before inserting so the new rows are pushed once
+            queue = self._queue(user_id)
+            ids = [r[0] for r in self._conn.execute(
+                "SELECT id FROM cards WHERE topic = ? AND id NOT IN"
+                " (SELECT card_id FROM reviews WHERE user_id = ?) ORDER BY random() LIMIT ?",
+                (topic, user_id, n),
+            )]
+            self._conn.executemany(
+                "INSERT INTO reviews (user_id, card_id, ease, interval, reps, due) VALUES (?, ?, ?, 0, 0, ?)",
+                [(user_id, card_id, INITIAL_EASE, now) for card_id in ids],
+            )
+            for card_id in ids:
+                queue.push(card_id, topic, now)
+            return self._cards(ids) if ids else []
+
+    def review(self, user_id, card_id, grade, now=None):
+        """Record a graded review and reschedule the card. Returns its next due time."""
+        now = time.time() if now is None else now
+        with self._lock, self._conn:
+            # Load the queue before the UPDATE so the new due time is pushed once
+            queue = self._queue(user_id)
+            row = self._conn.execute(
+                "SELECT r.ease, r.interval, r.reps, c.topic FROM reviews r JOIN cards c ON c.id = r.card_id"
+                " WHERE r.user_id = ? AND r.card_id = ?", (user_id, card_id)
+            ).fetchone()
+            if row is None:
+                raise KeyError(card_id)
+            ease, interval, reps = sm2(row[0], row[1], row[2], grade)
+            due = now + (interval * DAY if interval else RELEARN_DELAY)
+            self._conn.execute(
+                "UPDATE reviews SET ease = ?, interval = ?, reps = ?, due = ? WHERE user_id = ? AND card_id = ?",
+                (ease, interval, reps, due, user_id, card_id),
+            )
+            queue.push(card_id, row[3], due)
+            return due
+
+    def stats(self):
+        with self._lock:
+            cards = self._conn.execute("SELECT COUNT(*) FROM cards").fetchone()[0]
+            reviews = self._conn.execute("SELECT COUNT(*) FROM reviews").fetchone()[0]
+            return {"cards": cards, "user_cards": reviews, "cached_users": len(self._queues)}
@@ -0,0 +1,241 @@
+"""Incremental parsers for streamed quiz and flashcard output.
+
+Feed raw text chunks as they arrive from the model (chunk boundaries can
+fall anywhere, even inside a word). Each completed item is returned as soon
+as the line that closes it arrives, and malformed items are recorded in
+``errors`` without dropping the ones around them.
+
+The JSON parsers read the structured-output format instead: one JSON
+object holding an array of items, each checked as soon as its closing
+brace arrives.
+"""
+import json
+import re
+
+from question_bank import validate_question
+
+_QUESTION = re.compile(r"^\s*Question\s+\d+\s*:\s*(.*)$")
+_OPTION = re.compile(r"^\s*([A-D])[.)]\s*(.*)$")
+_ANSWER = re.compile(r"^\s*Answer\s*:\s*([A-D])\b")
+_CARD_Q = re.compile(r"^\s*Q\s*:\s*(.*)$")
+_CARD_A = re.compile(r"^\s*A\s*:\s*(.*)$")
+
+
+class _LineParser:
+    def __init__(self):
+        self.errors = []
+        self._partial = ""
+
+    def feed(self, chunk):
+        """Add a chunk of text; return the items it completed."""
+        self._partial += chunk
+        *lines, self._partial = self._partial.split("\n")
+        items = []
+        for line in lines:
+            items.extend(self._line(line))
+        return items
+
+    def close(self):
+        """Flush the final line at end of stream; return the last items."""
+        items = self._line(self._partial) if self._partial else []
+        self._partial = ""
+        return items + self._finish()
+
+    def _error(self, reason, text):
+        self.errors.append({"reason": reason, "text": text.strip()})
+
+
+class QuizStreamParser(_LineParser):
+    """Streams quiz items from the plain-text format ("Question N:", options
+    "A." to "D.", then "Answer:")."""
+
+    def __init__(self):
+        super().__init__()
+        self._current = None
+        self._last_key = None
+
+    def _line(self, line):
+        items = []
+        m = _QUESTION.match(line)
+        if m:
+            if self._current is not None:
+                self._error("missing answer", self._current["question"])
+            self._current = {"question": m.group(1), "options": {}}
+            self._last_key = "question"
+            return items
+        if self._current is None:
+            if line.strip():
+                self._error("text outside a question", line)
+            return items
+        m = _ANSWER.match(line)
+        if m:
+            q = self._current
+            self._current = None
+            q["question"] = q["question"].strip()
+            q["options"] = {k: v.strip() for k, v in q["options"].items()}
+            q["answer"] = m.group(1)
+            if validate_question(q):
+                items.append(q)
+            else:
+                self._error("incomplete options", q["question"])
+            return items
+        m = _OPTION.match(line)
+        if m:
+            self._current["options"][m.group(1)] = m.group(2)
+            self._last_key = m.group(1)
+        elif line.strip():
+            # Continuation of a wrapped stem or option
+            if self._last_key == "question":
+                self._current["question"] += " " + line.strip()
+            else:
+                self._current["options"][self._last_key] += " " + line.strip()
+        return items
+
+    def _finish(self):
+        if self._current is not None:
+            self._error("missing answer", self._current["question"])
+            self._current = None
+        return []
+
+
+class FlashcardStreamParser(_LineParser):
+    """Streams flashcards from "Q:" / "A:" lines. A card is complete once
+    the next ``Q:`` line (or the end of the stream) arrives."""
+
+    def __init__(self):
+        super().__init__()
+        self._question = None
+        self._answer = None
+
+    def _emit(self):
+        items = []
+        if self._question is not None:
+            if self._answer and self._answer.strip():
+                items.append({"question": self._question.strip(), "answer": self._answer.strip()})
+            else:
+                self._error("missing answer", self._question)
+        self._question = self._answer = None
+        return items
+
+    def _line(self, line):
+        m = _CARD_Q.match(line)
+        if m:
+            items = self._emit()
+            self._question = m.group(1)
+            return items
+        if self._question is None:
+            if line.strip():
+                self._error("text outside a card", line)
+            return []
+        m = _CARD_A.match(line)
+        if m and self._answer is None:
+            self._answer = m.group(1)
+        elif line.strip():
+            if self._answer is None:
+                self._question += " " + line.strip()
+            else:
+                self._answer += "\n" + line.strip()
+        return []
+
+    def _finish(self):
+        return self._emit()
+
+
+class _JsonItemsParser:
+    """Pulls each object out of the first JSON array in the stream (e.g.
+    ``{"items": [{...}, {...}]}`` or a bare ``[{...}]``) without waiting for
+    the rest of the document."""
+
+    def __init__(self):
+        self.errors = []
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._item = None      # text of the item being read
+        self._item_depth = 0
+
+    def feed(self, chunk):
+        items = []
+        for ch in chunk:
+            if self._item is not None:
+                self._item.append(ch)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+            if ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                if ch == "{" and self._item is None and self._stack and self._stack[-1] == "[":
+                    self._item = [ch]
+                    self._item_depth = len(self._stack)
+                self._stack.append(ch)
+            elif ch in "}]" and self._stack:
+                self._stack.pop()
+                if self._item is not None and len(self._stack) == self._item_depth:
+                    items.extend(self._finish_item("".join(self._item)))
+                    self._item = None
+        return items
+
+    def close(self):
+        if self._item is not None:
+            self._error("truncated item", "".join(self._item))
+            self._item = None
+        return []
+
+    def _finish_item(self, text):
+        try:
+            raw = json.loads(text)
+        except ValueError:
+            self._error("invalid JSON", text)
+            return []
+        item = self._build(raw) if isinstance(raw, dict) else None
+        if item is None:
+            self._error(self.invalid_reason, text)
+            return []
+        return [item]
+
+    def _error(self, reason, text):
+        self.errors.append({"reason": reason, "text": text.strip()})
+
+
+class QuizJsonParser(_JsonItemsParser):
+    """Items shaped ``{"question", "options": {"A".."D"}, "answer"}``; a list
+    of four options is accepted too and lettered A-D."""
+    invalid_reason = "incomplete options"
+
+    def _build(self, raw):
+        options = raw.get("options")
+        if isinstance(options, list):
+            options = dict(zip("ABCD", options))
+        if not isinstance(options, dict):
+            return None
+        q = {
+            "question": str(raw.get("question") or "").strip(),
+            "options": {str(k).strip().upper(): str(v).strip() for k, v in options.items()},
+            "answer": str(raw.get("answer") or "").strip().upper()[:1],
+        }
+        return q if validate_question(q) else None
+
+
+class FlashcardJsonParser(_JsonItemsParser):
+    """Items shaped ``{"question", "answer"}``."""
+    invalid_reason = "missing answer"
+
+    def _build(self, raw):
+        card = {
+            "question": str(raw.get("question") or "").strip(),
+            "answer": str(raw.get("answer") or "").strip(),
+        }
+        return card if card["question"] and card["answer"] else None
+
+
+def iter_items(parser, chunks):
+    """Yield completed items from ``parser`` as ``chunks`` stream in."""
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+    yield from parser.close()
@@ -0,0 +1,94 @@
+-- Per-user progress rollups, maintained on every quiz_scores insert so the
+-- Progress Tracker never has to scan a user's full attempt history.
+
+create table if not exists public.quiz_daily_rollups (
+    user_id   uuid    not null,
+    date      date    not null,
+    correct   integer not null default 0,
+    attempted integer not null default 0,
+    quizzes   integer not null default 0,
+    primary key (user_id, date)
+);
+
+create table if not exists public.quiz_daily_topic_rollups (
+    user_id   uuid    not null,
+    date      date    not null,
+    topic     text    not null,
+    correct   integer not null default 0,
+    attempted integer not null default 0,
+    quizzes   integer not null default 0,
+    primary key (user_id, date, topic)
+);
+
+create table if not exists public.quiz_topic_rollups (
+    user_id   uuid    not null,
+    topic     text    not null,
+    correct   integer not null default 0,
+    attempted integer not null default 0,
+    quizzes   integer not null default 0,
+    primary key (user_id, topic)
+);
+
+alter table public.quiz_daily_rollups       enable row level security;
+alter table public.quiz_daily_topic_rollups enable row level security;
+alter table public.quiz_topic_rollups       enable row level security;
+
+create policy "read own daily rollups" on public.quiz_daily_rollups
+    for select using (auth.uid() = user_id);
+create policy "read own daily topic rollups" on public.quiz_daily_topic_rollups
+    for select using (auth.uid() = user_id);
+create policy "read own topic rollups" on public.quiz_topic_rollups
+    for select using (auth.uid() = user_id);
+
+create or replace function public.apply_quiz_score_rollups()
+returns trigger
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+    insert into quiz_daily_rollups as r (user_id, date, correct, attempted, quizzes)
+    values (new.user_id, new.date::date, new.correct, new.attempted, 1)
+    on conflict (user_id, date) do update
+        set correct   = r.correct + excluded.correct,
+            attempted = r.attempted + excluded.attempted,
+            quizzes   = r.quizzes + 1;
+
+    insert into quiz_daily_topic_rollups as r (user_id, date, topic, correct, attempted, quizzes)
+    values (new.user_id, new.date::date, new.topic, new.correct, new.attempted, 1)
+    on conflict (user_id, date, topic) do update
+        set correct   = r.correct + excluded.correct,
+            attempted = r.attempted + excluded.attempted,
+            quizzes   = r.quizzes + 1;
+
+    insert into quiz_topic_rollups as r (user_id, topic, correct, attempted, quizzes)
+    values (new.user_id, new.topic, new.correct, new.attempted, 1)
+    on conflict (user_id, topic) do update
+        set correct   = r.correct + excluded.correct,
+            attempted = r.attempted + excluded.attempted,
+            quizzes   = r.quizzes + 1;
+
+    return new;
+end;
+$$;
+
+drop trigger if exists quiz_scores_rollups on public.quiz_scores;
+create trigger quiz_scores_rollups
+    after insert on public.quiz_scores
+    for each row execute function public.apply_quiz_score_rollups();
+
+-- Backfill from existing attempts (safe to run once on an empty rollup set)
+insert into public.quiz_daily_rollups (user_id, date, correct, attempted, quizzes)
+select user_id, date::date, sum(correct), sum(attempted), count(*)
+from public.quiz_scores group by user_id, date::date
+on conflict do nothing;
+
+insert into public.quiz_daily_topic_rollups (user_id, date, topic, correct, attempted, quizzes)
+select user_id, date::date, topic, sum(correct), sum(attempted), count(*)
+from public.quiz_scores group by user_id, date::date, topic
+on conflict do nothing;
+
+insert into public.quiz_topic_rollups (user_id, topic, correct, attempted, quizzes)
+select user_id, topic, sum(correct), sum(attempted), count(*)
+from public.quiz_scores group by user_id, topic
+on conflict do nothing;
@@ -0,0 +1,50 @@
+-- Progress reads for the app. The rollup tables only let a user read their
+-- own rows (auth.uid() = user_id), but the app's shared client carries no
+-- user JWT. These functions take the user id explicitly and may only be
+-- called with the service-role key.
+
+create or replace function public.progress_topics(p_user_id uuid)
+returns table (topic text, correct integer, attempted integer)
+language sql
+stable
+security definer
+set search_path = public
+as $$
+    select topic, correct, attempted
+    from quiz_topic_rollups
+    where user_id = p_user_id;
+$$;
+
+create or replace function public.progress_days(p_user_id uuid, p_offset integer, p_limit integer)
+returns table (date date, correct integer, attempted integer)
+language sql
+stable
+security definer
+set search_path = public
+as $$
+    select date, correct, attempted
+    from quiz_daily_rollups
+    where user_id = p_user_id
+    order by date desc
+    offset p_offset
+    limit p_limit;
+$$;
+
+create or replace function public.progress_day_topics(p_user_id uuid, p_dates date[])
+returns table (date date, topic text, correct integer, attempted integer)
+language sql
+stable
+security definer
+set search_path = public
+as $$
+    select date, topic, correct, attempted
+    from quiz_daily_topic_rollups
+    where user_id = p_user_id and date = any (p_dates);
+$$;
+
+revoke execute on function public.progress_topics(uuid) from public, anon, authenticated;
+revoke execute on function public.progress_days(uuid, integer, integer) from public, anon, authenticated;
+revoke execute on function public.progress_day_topics(uuid, date[]) from public, anon, authenticated;
+grant execute on function public.progress_topics(uuid) to service_role;
+grant execute on function public.progress_days(uuid, integer, integer) to service_role;
+grant execute on function public.progress_day_topics(uuid, date[]) to service_role;
@@ -0,0 +1,8 @@
+-- Client-generated id per quiz score, so a retried batch insert can't
+-- count a score twice: the app upserts on client_id and ignores rows that
+-- already exist. Skipped rows don't fire the rollup trigger.
+
+alter table public.quiz_scores add column if not exists client_id uuid;
+
+create unique index if not exists quiz_scores_client_id_key
+    on public.quiz_scores (client_id);
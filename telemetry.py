@@ -0,0 +1,201 @@
+"""Lightweight tracing and Prometheus-style metrics.
+
+Every external call and page render is wrapped in a timed span tagged with
+the page and call name. Spans feed a latency histogram and an error
+counter; a sample of them is kept as JSON traces. Metrics can be served on
+a local port (``/metrics`` and ``/traces``) or written to a file.
+"""
+import contextvars
+import json
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Histogram bucket upper bounds, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# Share of spans kept as traces, and how many are kept
+TRACE_SAMPLE_RATE = 0.1
+MAX_TRACES = 1000
+
+_page = contextvars.ContextVar("page", default="background")
+_lock = threading.Lock()
+_counters = defaultdict(float)          # (name, labels) -> value
+_histograms = {}                        # (name, labels) -> [bucket counts..., sum, count]
+_collectors = {}                        # metric prefix -> fn returning {stat: number}
+_traces = deque(maxlen=MAX_TRACES)
+
+
+def _labels(**labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+
+def inc(name, value=1, **labels):
+    with _lock:
+        _counters[(name, _labels(**labels))] += value
+
+
+def observe(name, value, **labels):
+    key = (name, _labels(**labels))
+    with _lock:
+        hist = _histograms.setdefault(key, [0] * (len(BUCKETS) + 2))
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                hist[i] += 1
+        hist[-2] += value
+        hist[-1] += 1
+
+
+def register_collector(prefix, fn):
+    """Export ``fn()``'s numeric stats as ``<prefix>_<stat>`` gauges."""
+    _collectors[prefix] = fn
+
+
+def set_page(page):
+    """Tag spans from the current thread/rerun with a page name."""
+    _page.set(page)
+
+
+def current_page():
+    return _page.get()
+
+
+@contextmanager
+def span(call, **tags):
+    """Time a block as ``call`` on the current page; errors are counted and re-raised."""
+    page = tags.pop("page", None) or _page.get()
+    start = time.perf_counter()
+    started_at = time.time()
+    error = None
+    try:
+        yield tags
+    except Exception as e:
+        error = type(e).__name__
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        observe("dmv_call_seconds", elapsed, call=call, page=page)
+        inc("dmv_calls_total", call=call, page=page)
+        if error:
+            inc("dmv_call_errors_total", call=call, page=page, error=error)
+        if random.random() < TRACE_SAMPLE_RATE:
+            with _lock:
+                _traces.append({"call": call, "page": page, "start": started_at,
+                                "duration_ms": round(elapsed * 1000, 3), "error": error,
+                                "tags": {k: v for k, v in tags.items() if v is not None}})
+
+
+def traced(call):
+    """Decorator form of span()."""
+    def wrap(fn):
+        def inner(*args, **kwargs):
+            with span(call):
+                return fn(*args, **kwargs)
+        inner.__name__, inner.__doc__ = fn.__name__, fn.__doc__
+        return inner
+    return wrap
+
+
+def record_usage(model, usage, page=None):
+    """Count OpenAI token usage from a response's ``usage`` object."""
+    if usage is None:
+        return
+    page = page or _page.get()
+    inc("dmv_openai_tokens_total", usage.prompt_tokens or 0, model=model, kind="prompt", page=page)
+    inc("dmv_openai_tokens_total", usage.completion_tokens or 0, model=model, kind="completion", page=page)
+
+
+class PageTimer:
+    """Times one page render. Call finish() from a finally block so renders
+    cut short by st.stop() or st.rerun() are counted too."""
+
+    def __init__(self, page):
+        set_page(page)
+        self.page = page
+        self.start = time.perf_counter()
+
+    def finish(self):
+        observe("dmv_page_render_seconds", time.perf_counter() - self.start, page=self.page)
+
+
+# === Export ===
+def _fmt(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+def render_prometheus():
+    lines = []
+    with _lock:
+        counters = dict(_counters)
+        histograms = {k: list(v) for k, v in _histograms.items()}
+    for name in sorted({n for n, _ in counters}):
+        lines.append(f"# TYPE {name} counter")
+        for (n, labels), value in sorted(counters.items()):
+            if n == name:
+                lines.append(f"{name}{_fmt(labels)} {value:g}")
+    for name in sorted({n for n, _ in histograms}):
+        lines.append(f"# TYPE {name} histogram")
+        for (n, labels), hist in sorted(histograms.items()):
+            if n != name:
+                continue
+            for bound, count in zip(BUCKETS, hist):
+                lines.append(f"{name}_bucket{_fmt(labels, [('le', f'{bound:g}')])} {count}")
+            lines.append(f"{name}_bucket{_fmt(labels, [('le', '+Inf')])} {hist[-1]}")
+            lines.append(f"{name}_sum{_fmt(labels)} {hist[-2]:g}")
+            lines.append(f"{name}_count{_fmt(labels)} {hist[-1]}")
+    for prefix, fn in sorted(_collectors.items()):
+        try:
+            stats = fn()
+        except Exception:
+            continue
+        for stat, value in sorted(stats.items()):
+            if isinstance(value, (int, float)):
+                lines.append(f"# TYPE {prefix}_{stat} gauge")
+                lines.append(f"{prefix}_{stat} {value:g}")
+    return "\n".join(lines) + "\n"
+
+
+def dump_traces(path=None):
+    """Return the sampled traces as JSON, also writing them to ``path`` if given."""
+    with _lock:
+        data = json.dumps(list(_traces), indent=2)
+    if path:
+        with open(path, "w") as f:
+            f.write(data)
+    return data
+
+
+def write_metrics(path):
+    with open(path, "w") as f:
+        f.write(render_prometheus())
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.startswith("/metrics"):
+            body, kind = render_prometheus(), "text/plain; version=0.0.4"
+        elif self.path.startswith("/traces"):
+            body, kind = dump_traces(), "application/json"
+        else:
+            self.send_error(404)
+            return
+        data = body.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", kind)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def start_metrics_server(port, host="127.0.0.1"):
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
@@ -0,0 +1,80 @@
+import time
+
+from fulfillment import GRANT_BACKOFF, GRANT_MAX_BACKOFF, Fulfiller, Ledger
+
+
+class DataError(Exception):
+    code = "22P02"      # invalid_text_representation, e.g. a bad uuid
+
+
+def paid_event(n, user_id="u1"):
+    return {"id": f"evt_{n}", "data": {"object": {
+        "id": f"cs_{n}", "payment_status": "paid", "metadata": {"user_id": user_id},
+    }}}
+
+
+def test_grant_failures_back_off_and_never_give_up(tmp_path):
+    ledger = Ledger(str(tmp_path / "fulfillment.db"))
+    ledger.record(paid_event(1))
+    outage = True
+    granted = []
+
+    def grant(user_ids):
+        if outage:
+            raise ConnectionError("supabase down")
+        granted.extend(user_ids)
+
+    fulfiller = Fulfiller(ledger, grant)
+    for _ in range(10):
+        assert fulfiller.run_once() == 0
+        # Not retried again until its backoff has passed
+        assert ledger.pending() == []
+        assert ledger.pending(now=time.time() + GRANT_MAX_BACKOFF + 1)
+        with ledger._conn:
+            ledger._conn.execute("UPDATE purchases SET next_attempt_at = 0")
+    assert ledger.status("cs_1") == ("pending", "u1")
+
+    outage = False
+    assert fulfiller.run_once() == 1
+    assert granted == ["u1"]
+    assert ledger.status("cs_1") == ("granted", "u1")
+
+
+def test_bad_user_does_not_block_the_batch(tmp_path, caplog):
+    ledger = Ledger(str(tmp_path / "fulfillment.db"))
+    for n, uid in enumerate(["good-1", "not-a-uuid", "good-2"]):
+        ledger.record(paid_event(n, user_id=uid))
+    granted = []
+
+    def grant(user_ids):
+        if "not-a-uuid" in user_ids:
+            raise DataError('invalid input syntax for type uuid: "not-a-uuid"')
+        granted.extend(user_ids)
+
+    fulfiller = Fulfiller(ledger, grant)
+    assert fulfiller.run_once() == 3
+    assert sorted(granted) == ["good-1", "good-2"]
+    assert ledger.status("cs_0") == ("granted", "good-1")
+    assert ledger.status("cs_2") == ("granted", "good-2")
+    assert ledger.status("cs_1") == ("failed", "not-a-uuid")
+    assert ledger.pending(now=float("inf")) == []
+    assert any(r.levelname == "ERROR" and "not-a-uuid" in r.getMessage() for r in caplog.records)
+
+
+def test_first_retry_waits_base_backoff(tmp_path):
+    ledger = Ledger(str(tmp_path / "fulfillment.db"))
+    ledger.record(paid_event(1))
+    assert ledger.mark_attempt_failed(["cs_1"], "boom", now=100) == 1
+    assert ledger.pending(now=100 + GRANT_BACKOFF - 0.1) == []
+    assert ledger.pending(now=100 + GRANT_BACKOFF) == [("cs_1", "u1")]
+
+
+def test_requeue_recovers_failed_purchases(tmp_path):
+    ledger = Ledger(str(tmp_path / "fulfillment.db"))
+    ledger.record(paid_event(1))
+    ledger.record(paid_event(2, user_id=None))
+    with ledger._conn:
+        ledger._conn.execute("UPDATE purchases SET status = 'failed', next_attempt_at = 1e12")
+    # Only the purchase with a user can be granted
+    assert ledger.requeue() == 1
+    assert ledger.pending() == [("cs_1", "u1")]
@@ -0,0 +1,101 @@
+import threading
+import time
+
+import pytest
+
+import llm_scheduler
+from llm_scheduler import BACKGROUND, GENERATION, INTERACTIVE, LLMScheduler, SchedulerBusy
+
+
+def queue_up(scheduler, admitted, label, priority=GENERATION, user=None):
+    """Start a thread that waits for a slot and records label once admitted."""
+    waiting = scheduler.stats()["waiting"]
+    thread = threading.Thread(
+        target=lambda: (scheduler.acquire(priority, user, timeout=5), admitted.append(label)), daemon=True
+    )
+    thread.start()
+    while scheduler.stats()["waiting"] == waiting:
+        time.sleep(0.001)
+    return thread
+
+
+def admit_all(scheduler, admitted, threads):
+    for n in range(len(threads)):
+        scheduler.release()
+        while len(admitted) == n:
+            time.sleep(0.001)
+    for thread in threads:
+        thread.join(5)
+    return admitted
+
+
+def test_higher_priority_goes_first():
+    scheduler = LLMScheduler(max_concurrent=1)
+    scheduler.acquire()
+    admitted = []
+    threads = [queue_up(scheduler, admitted, name, priority)
+               for name, priority in [("background", BACKGROUND), ("generation", GENERATION),
+                                      ("interactive", INTERACTIVE)]]
+    admit_all(scheduler, admitted, threads)
+    assert admitted == ["interactive", "generation", "background"]
+
+
+def test_users_are_served_round_robin():
+    scheduler = LLMScheduler(max_concurrent=1)
+    scheduler.acquire()
+    admitted = []
+    threads = [queue_up(scheduler, admitted, f"{user}-{n}", user=user)
+               for user, n in [("u1", 1), ("u1", 2), ("u1", 3), ("u2", 1)]]
+    admit_all(scheduler, admitted, threads)
+    assert admitted == ["u1-1", "u2-1", "u1-2", "u1-3"]
+
+
+def test_full_queue_rejects_immediately():
+    scheduler = LLMScheduler(max_concurrent=1, max_queue=2)
+    scheduler.acquire()
+    admitted = []
+    threads = [queue_up(scheduler, admitted, n) for n in range(2)]
+    start = time.perf_counter()
+    with pytest.raises(SchedulerBusy):
+        scheduler.acquire(GENERATION, timeout=5)
+    assert time.perf_counter() - start < 1
+    assert not scheduler.try_acquire()
+    assert scheduler.stats()["rejected"] == 1
+    admit_all(scheduler, admitted, threads)
+    assert admitted == [0, 1]
+
+
+def test_timeout_leaves_the_queue():
+    scheduler = LLMScheduler(max_concurrent=1)
+    scheduler.acquire()
+    with pytest.raises(SchedulerBusy):
+        scheduler.acquire(timeout=0.01)
+    scheduler.release()
+    assert scheduler.stats()["waiting"] == 0
+    assert scheduler.stats()["active"] == 0
+    assert scheduler.try_acquire()
+
+
+def test_grant_racing_the_timeout_keeps_the_slot(monkeypatch):
+    scheduler = LLMScheduler(max_concurrent=1)
+    scheduler.acquire()
+
+    class RacingWaiter(llm_scheduler._Waiter):
+        def __init__(self):
+            super().__init__()
+            wait = self.event.wait
+
+            def late_grant(timeout):
+                # Times out, then the slot is handed over before the waiter
+                # takes the lock again
+                wait(0)
+                scheduler.release()
+                return False
+            self.event.wait = late_grant
+
+    monkeypatch.setattr(llm_scheduler, "_Waiter", RacingWaiter)
+    scheduler.acquire(timeout=0.01)
+    stats = scheduler.stats()
+    assert (stats["active"], stats["waiting"], stats["timed_out"]) == (1, 0, 0)
+    scheduler.release()
+    assert scheduler.stats()["active"] == 0
@@ -0,0 +1,20 @@
+import threading
+
+from near_dup import NearDupIndex
+
+STORED = {"question": "What does a red octagon sign mean?", "answer": "Stop."}
+
+
+def test_filter_waits_for_background_seed():
+    release = threading.Event()
+
+    def stored_items():
+        release.wait(5)
+        yield ("flashcards", "Road Signs"), STORED
+
+    index = NearDupIndex().seed_in_background(stored_items)
+    assert index.stats()["seeding"] == 1
+    threading.Timer(0.05, release.set).start()
+    new = {"question": "How long must you stop at a stop sign?", "answer": "Until it is safe."}
+    assert index.filter(("flashcards", "Road Signs"), [dict(STORED), new]) == [new]
+    assert index.stats()["seeding"] == 0
@@ -0,0 +1,9 @@
+from pdf_export import _inline, create_pdf
+
+
+def test_inline_markup():
+    assert _inline("**Stop** & _yield_") == "<b>Stop</b> &amp; <i>yield</i>"
+
+
+def test_crossed_markers_still_render():
+    assert create_pdf("Q1: _a **b_ c**\nA1: fine").startswith(b"%PDF")
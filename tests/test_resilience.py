@@ -0,0 +1,177 @@
+import threading
+
+import pytest
+
+from resilience import CircuitBreaker, CircuitOpen, Resilience
+
+
+class Status(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+def open_breaker(breaker):
+    for _ in range(breaker.min_calls):
+        breaker.record(False)
+
+
+# === CircuitBreaker state transitions ===
+def test_stays_closed_below_min_calls():
+    breaker = CircuitBreaker(min_calls=5)
+    for _ in range(4):
+        breaker.record(False)
+    assert breaker.state == "closed"
+    assert breaker.allow()
+
+
+def test_opens_when_error_rate_spikes():
+    breaker = CircuitBreaker(min_calls=4, error_rate=0.5, cooldown=60)
+    breaker.record(True)
+    breaker.record(True)
+    breaker.record(False)
+    assert breaker.state == "closed"
+    breaker.record(False)
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+
+def test_half_open_lets_one_trial_through():
+    breaker = CircuitBreaker(cooldown=0)
+    open_breaker(breaker)
+    assert breaker.state == "half-open"
+    assert breaker.allow()
+    assert not breaker.allow()
+
+
+def test_trial_success_closes():
+    breaker = CircuitBreaker(cooldown=0)
+    open_breaker(breaker)
+    trial = breaker.allow()
+    assert trial
+    breaker.record(True, trial)
+    assert breaker.state == "closed"
+    assert breaker.allow()
+
+
+def test_stale_success_does_not_close():
+    breaker = CircuitBreaker(cooldown=60)
+    open_breaker(breaker)
+    breaker.record(True)
+    assert breaker.state == "open"
+    breaker.opened_at -= 60
+    trial = breaker.allow()
+    breaker.record(True)
+    breaker.release()
+    assert breaker.state == "half-open"
+    assert not breaker.allow()
+    breaker.record(False, trial)
+    assert breaker.state == "open"
+
+
+def test_trial_failure_reopens():
+    breaker = CircuitBreaker(cooldown=60)
+    open_breaker(breaker)
+    breaker.opened_at -= 60
+    trial = breaker.allow()
+    assert trial
+    breaker.record(False, trial)
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+
+def test_release_frees_the_trial():
+    breaker = CircuitBreaker(cooldown=0)
+    open_breaker(breaker)
+    trial = breaker.allow()
+    assert trial
+    breaker.release(trial)
+    assert breaker.state == "half-open"
+    assert breaker.allow()
+
+
+# === Resilience.call and the breaker ===
+def test_rejected_trial_does_not_wedge_breaker():
+    res = Resilience("primary", retries=0)
+    breaker = res.breakers["primary"]
+    breaker.cooldown = 0
+    open_breaker(breaker)
+
+    def rejected(model, timeout):
+        raise Status(400)
+
+    with pytest.raises(Status):
+        res.call(rejected, hedge=False)
+    assert res.call(lambda model, timeout: "ok", hedge=False) == "ok"
+    assert breaker.state == "closed"
+
+
+def test_deadline_does_not_claim_trial():
+    res = Resilience("primary", deadline=0)
+    breaker = res.breakers["primary"]
+    breaker.cooldown = 0
+    open_breaker(breaker)
+    with pytest.raises(TimeoutError):
+        res.call(lambda model, timeout: "ok", hedge=False)
+    assert breaker.allow()
+
+
+def test_falls_back_then_raises_when_every_circuit_is_open():
+    res = Resilience("primary", "fallback")
+    open_breaker(res.breakers["primary"])
+    assert res.call(lambda model, timeout: model, hedge=False) == "fallback"
+    open_breaker(res.breakers["fallback"])
+    with pytest.raises(CircuitOpen):
+        res.call(lambda model, timeout: model, hedge=False)
+
+
+def test_shard_results_feed_the_breaker():
+    res = Resilience("primary")
+    breaker = res.breakers["primary"]
+    for _ in range(breaker.min_calls):
+        res.record_result("primary", Status(400))
+    assert breaker.state == "closed"
+    for _ in range(breaker.min_calls):
+        res.record_result("primary", TimeoutError())
+    assert breaker.state == "open"
+    res.record_result("primary")
+    assert breaker.state == "open"
+    assert res.preferred_model() is None
+
+
+def test_hedge_needs_a_free_slot(monkeypatch):
+    slots = threading.Semaphore(0)
+    released = threading.Event()
+    res = Resilience("primary", acquire_hedge=lambda: slots.acquire(blocking=False),
+                     release_hedge=released.set)
+    monkeypatch.setattr(res, "hedge_delay", lambda model, kind: 0.01)
+    first = threading.Event()
+
+    def slow_first(model, timeout):
+        if not first.is_set():
+            first.set()
+            threading.Event().wait(0.1)
+            return "first"
+        return "hedge"
+
+    assert res.call(slow_first) == "first"
+    assert res.hedges == 0
+
+    first.clear()
+    slots.release()
+    assert res.call(slow_first) == "hedge"
+    assert res.hedges == 1
+    assert released.wait(1)
+
+
+def test_no_backoff_after_last_attempt(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr("resilience.time.sleep", sleeps.append)
+    res = Resilience("primary", retries=2)
+
+    def failing(model, timeout):
+        raise Status(503)
+
+    with pytest.raises(Status):
+        res.call(failing, hedge=False)
+    assert len(sleeps) == 2
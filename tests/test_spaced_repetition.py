@@ -0,0 +1,30 @@
+from spaced_repetition import CardStore, sm2
+
+CARDS = [{"question": f"Question {i}?", "answer": f"Answer {i}"} for i in range(3)]
+
+
+def test_sm2_failed_card_starts_over():
+    assert sm2(2.5, 6, 2, 1)[1:] == (0, 0)
+    assert sm2(2.5, 0, 0, 4)[1:] == (1, 1)
+    assert sm2(2.5, 1, 1, 4)[1:] == (6, 2)
+
+
+def test_review_after_reload_yields_card_once(tmp_path):
+    path = str(tmp_path / "cards.db")
+    store = CardStore(path)
+    store.add_cards("Signs", CARDS)
+    card_ids = [c["card_id"] for c in store.assign_new("u1", "Signs", 3, now=0)]
+
+    # A fresh store (restart, or the user's queue evicted) loads it from disk
+    store = CardStore(path)
+    store.review("u1", card_ids[-1], 1, now=0)
+    due = [c["card_id"] for c in store.due("u1", 10, now=10 ** 6)]
+    assert sorted(due) == sorted(card_ids)
+
+
+def test_graded_card_waits_until_due(tmp_path):
+    store = CardStore(str(tmp_path / "cards.db"))
+    store.add_cards("Signs", CARDS)
+    card_ids = [c["card_id"] for c in store.assign_new("u1", "Signs", 3, now=0)]
+    store.review("u1", card_ids[0], 5, now=0)
+    assert sorted(c["card_id"] for c in store.due("u1", 10, now=1)) == sorted(card_ids[1:])
@@ -0,0 +1,117 @@
+import json
+
+import pytest
+
+from stream_parse import (FlashcardJsonParser, FlashcardStreamParser, QuizJsonParser, QuizStreamParser,
+                          iter_items)
+
+CHUNK_SIZES = [1, 2, 3, 7]
+
+
+def parse(parser, text, size):
+    chunks = [text[i:i + size] for i in range(0, len(text), size)]
+    return list(iter_items(parser, chunks)), [e["reason"] for e in parser.errors]
+
+
+# === Plain-text formats ===
+QUIZ_TEXT = (
+    "Question 1: What does a red octagon mean?\n"
+    "A. Yield\nB. Stop\nC. Merge\nD. Slow down\n"
+    "Answer: B\n\n"
+    "Question 2: Only three options here?\n"
+    "A. One\nB. Two\nC. Three\n"
+    "Answer: A\n\n"
+    "Question 3: What is the speed limit in a school zone\n"
+    "when children are present?\n"
+    "A. 15 mph\nB. 25 mph\nC. 35 mph\nD. 45 mph\n"
+    "Answer: A"
+)
+
+
+@pytest.mark.parametrize("size", CHUNK_SIZES)
+def test_quiz_text_any_chunking(size):
+    items, errors = parse(QuizStreamParser(), QUIZ_TEXT, size)
+    assert [q["question"] for q in items] == [
+        "What does a red octagon mean?",
+        "What is the speed limit in a school zone when children are present?",
+    ]
+    assert items[0]["options"]["B"] == "Stop"
+    assert [q["answer"] for q in items] == ["B", "A"]
+    assert errors == ["incomplete options"]
+
+
+FLASHCARD_TEXT = (
+    "Q: What does a flashing yellow light mean?\n"
+    "A: Slow down and proceed with caution.\n"
+    "Q: A card the model forgot to answer\n"
+    "Q: When must you stop for a school bus?\n"
+    "A: When its red lights flash and stop arm is out,\n"
+    "unless a median divides the road.\n"
+)
+
+
+@pytest.mark.parametrize("size", CHUNK_SIZES)
+def test_flashcard_text_any_chunking(size):
+    items, errors = parse(FlashcardStreamParser(), FLASHCARD_TEXT, size)
+    assert items == [
+        {"question": "What does a flashing yellow light mean?",
+         "answer": "Slow down and proceed with caution."},
+        {"question": "When must you stop for a school bus?",
+         "answer": "When its red lights flash and stop arm is out,\nunless a median divides the road."},
+    ]
+    assert errors == ["missing answer"]
+
+
+# === JSON formats ===
+TRICKY_STEM = 'What does a sign reading "STOP {ALL WAY}" mean, and is \\ a [lane] marker?'
+QUIZ_JSON = json.dumps({"items": [
+    {"question": TRICKY_STEM, "options": {"A": "Yield", "B": 'All "four" directions stop', "C": "}", "D": "{"},
+     "answer": "B"},
+    {"question": "Only three options?", "options": {"A": "One", "B": "Two", "C": "Three"}, "answer": "A"},
+    {"question": "Lettered from a list?", "options": ["One", "Two", "Three", "Four"], "answer": "d"},
+]})
+
+
+@pytest.mark.parametrize("size", CHUNK_SIZES)
+def test_quiz_json_any_chunking(size):
+    items, errors = parse(QuizJsonParser(), QUIZ_JSON, size)
+    assert [q["question"] for q in items] == [TRICKY_STEM, "Lettered from a list?"]
+    assert items[0]["options"] == {"A": "Yield", "B": 'All "four" directions stop', "C": "}", "D": "{"}
+    assert items[1]["options"]["D"] == "Four"
+    assert [q["answer"] for q in items] == ["B", "D"]
+    assert errors == ["incomplete options"]
+
+
+FLASHCARD_JSON = (
+    '{"items": ['
+    '{"question": "Say \\"yield\\" means?", "answer": "Let others {go} first."}, '
+    '{"question": "Broken", "answer": oops}, '
+    '{"question": "No answer", "answer": ""}, '
+    '{"question": "Headlights on when?", "answer": "From sunset to sunrise."}'
+    ']}'
+)
+
+
+@pytest.mark.parametrize("size", CHUNK_SIZES)
+def test_flashcard_json_any_chunking(size):
+    items, errors = parse(FlashcardJsonParser(), FLASHCARD_JSON, size)
+    assert items == [
+        {"question": 'Say "yield" means?', "answer": "Let others {go} first."},
+        {"question": "Headlights on when?", "answer": "From sunset to sunrise."},
+    ]
+    assert errors == ["invalid JSON", "missing answer"]
+
+
+def test_json_items_arrive_before_the_document_ends():
+    parser = FlashcardJsonParser()
+    first, _ = FLASHCARD_JSON.split("}, ", 1)
+    assert parser.feed(first + "}, ") == [
+        {"question": 'Say "yield" means?', "answer": "Let others {go} first."}
+    ]
+
+
+def test_json_truncated_item_is_an_error():
+    parser = QuizJsonParser()
+    items, errors = parse(parser, QUIZ_JSON[:-40], 7)
+    assert len(items) == 1
+    assert errors == ["incomplete options", "truncated item"]